@@ -0,0 +1,118 @@
+"""
+Local cache of Stellar account states: sequence number, balances and
+trustlines, as returned by Horizon's /accounts endpoint.
+
+States are memoized for the process, cached on disk, and reloaded from
+Horizon when older than settings.ACCOUNT_STATE_TTL seconds. They are updated
+locally after each transaction submitted by this wallet, so consecutive
+submissions don't reload the account. A submission failing with tx_bad_seq
+means the cached state is stale, see is_bad_seq().
+"""
+import threading
+import time
+from decimal import Decimal
+import cache
+import settings
+
+MAX_LIMIT = '922337203685.4775807'
+
+_STATES = {}
+_lock = threading.RLock()
+
+
+def _key(account_id):
+    return f'{settings.STELLAR_NETWORK}:{account_id}'
+
+
+def load(account_id=None, refresh=False):
+    """
+    Returns the state of account_id (default settings.PUBKEY).
+    """
+    account_id = account_id or settings.PUBKEY
+    key = _key(account_id)
+    state = None if refresh else _STATES.get(key) or cache.load('accounts', key)
+    if state is None or state['loaded_at'] + settings.ACCOUNT_STATE_TTL < time.time():
+        record = settings.HORIZON_SERVER.accounts().account_id(account_id).call()
+        state = {
+            'account_id': account_id,
+            'sequence': int(record['sequence']),
+            'balances': record['balances'],
+            'loaded_at': time.time(),
+        }
+        save(state)
+    _STATES[key] = state
+    return state
+
+
+def save(state):
+    with _lock:
+        cache.store('accounts', _key(state['account_id']), state)
+
+
+def source_account(state):
+    """
+    Returns a stellar_sdk Account to build the next transaction of state.
+    """
+    from stellar_sdk.account import Account
+    return Account(state['account_id'], state['sequence'])
+
+
+def trustlines(state):
+    """
+    Returns {(asset_code, asset_issuer): balance record} for the trustlines of state.
+    """
+    return {
+        (balance['asset_code'], balance['asset_issuer']): balance
+        for balance in state['balances']
+        # liquidity pool shares have no asset code
+        if balance['asset_type'] in ('credit_alphanum4', 'credit_alphanum12')
+    }
+
+
+def same_limit(a, b):
+    return Decimal(a or MAX_LIMIT) == Decimal(b or MAX_LIMIT)
+
+
+def applied(state):
+    """
+    Updates state after a transaction sourced from it succeeded.
+    """
+    with _lock:
+        state['sequence'] += 1
+        save(state)
+
+
+def trust_changed(state, change_trust_ops):
+    """
+    Updates state after its (asset_code, asset_issuer, limit) trustline
+    changes succeeded.
+    """
+    with _lock:
+        lines = trustlines(state)
+        for asset_code, asset_issuer, limit in change_trust_ops:
+            line = lines.get((asset_code, asset_issuer))
+            if Decimal(limit or MAX_LIMIT) == 0:
+                if line is not None:
+                    state['balances'].remove(line)
+            elif line is not None:
+                line['limit'] = limit or MAX_LIMIT
+            else:
+                line = {
+                    'asset_type': 'credit_alphanum4' if len(asset_code) <= 4 else 'credit_alphanum12',
+                    'asset_code': asset_code,
+                    'asset_issuer': asset_issuer,
+                    'balance': '0.0000000',
+                    'limit': limit or MAX_LIMIT,
+                }
+                state['balances'].append(line)
+                lines[(asset_code, asset_issuer)] = line
+        save(state)
+
+
+def is_bad_seq(error):
+    """
+    Returns whether a stellar_sdk BadRequestError was caused by a stale
+    sequence number.
+    """
+    extras = getattr(error, 'extras', None) or {}
+    return extras.get('result_codes', {}).get('transaction') == 'tx_bad_seq'
@@ -0,0 +1,19 @@
+"""
+Asyncio client API
+
+Awaitable equivalents of the sep1/sep6/sep10/sep12/sep24/sep31 functions.
+They share one aiohttp session per event loop, and the same stellar.toml and
+SEP-10 token caches as the synchronous modules.
+
+    import asyncio
+    import aio
+    from aio import sep24
+
+    async def main():
+        try:
+            return await asyncio.gather(*[sep24.transaction({'id': i}) for i in ids])
+        finally:
+            await aio.close()
+"""
+from aio import sep1, sep6, sep10, sep12, sep24, sep31
+from aio.transport import close
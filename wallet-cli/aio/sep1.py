@@ -0,0 +1,29 @@
+import asyncio
+import cache
+import settings
+import sep1
+from aio import transport
+
+_pending = {}
+
+
+async def _fetch(anchor_domain, entry):
+    response = await transport.get(sep1._url(anchor_domain), idempotent=True,
+            headers=sep1._conditional_headers(entry))
+    return sep1._update(anchor_domain, entry, response)
+
+
+async def fetch_stellar_toml(anchor_domain=None):
+    anchor_domain = anchor_domain if anchor_domain is not None else settings.ANCHOR_DOMAIN
+    entry = sep1._cached(anchor_domain)
+    if cache.is_fresh(entry):
+        sep1._STELLAR_TOMLS[anchor_domain] = entry
+        return entry['data']
+
+    # concurrent callers wait for the same fetch
+    key = (asyncio.get_running_loop(), anchor_domain)
+    task = _pending.get(key)
+    if task is None:
+        task = _pending[key] = asyncio.ensure_future(_fetch(anchor_domain, entry))
+        task.add_done_callback(lambda _: _pending.pop(key, None))
+    return await asyncio.shield(task)
@@ -0,0 +1,151 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from stellar_sdk.keypair import Keypair
+import settings
+import tokens
+import tracing
+from sep10 import sign_challenge, verify_and_sign
+from aio import transport
+from aio.sep1 import fetch_stellar_toml
+
+_pending = {}
+# challenges signed per worker process before auth_many() uses more than one
+SIGNATURES_PER_WORKER = 100
+
+
+async def auth(secret=None):
+    stellar_toml = await fetch_stellar_toml()
+    auth_url = stellar_toml['WEB_AUTH_ENDPOINT']
+
+    # get challenge transaction and sign it
+    client_signing_key = Keypair.from_secret(secret or settings.SECRET)
+    # each challenge is a transaction built and signed by the anchor: retried, never duplicated
+    response = await transport.get(auth_url, idempotent=True, hedged=False,
+                                   params={'account': client_signing_key.public_key})
+    content = response.json()
+
+    # submit the signed transaction to prove ownership of the account
+    response = await transport.post(
+        auth_url,
+        json=sign_challenge(content, client_signing_key),
+    )
+    return response.json()['token']
+
+
+async def _refresh(secret, account, rejected):
+    # the same file lock as tokens.get_token(), waited for in a thread
+    loop = asyncio.get_running_loop()
+    lock = tokens.locked(secret)
+    await loop.run_in_executor(None, lock.__enter__)
+    try:
+        # another process may have refreshed it while we waited
+        token = tokens.lookup(secret)
+        if token is None or token == rejected:
+            token = await auth(secret)
+            if tokens.is_valid(token):
+                tokens.save(secret, token, holding_lock=True)
+    finally:
+        lock.__exit__(None, None, None)
+    return token
+
+
+async def get_token(secret=None, rejected=None):
+    """
+    Awaitable tokens.get_token(): returns a cached SEP-10 token, doing a
+    single handshake per account when it has to be refreshed. rejected is a
+    token the anchor refused, which is refreshed even if not expired.
+    """
+    secret = secret or settings.SECRET
+    account = Keypair.from_secret(secret).public_key
+    token = tokens.lookup(secret)
+    if token is not None and token != rejected:
+        return token
+
+    key = (asyncio.get_running_loop(), account)
+    task = _pending.get(key)
+    if task is None:
+        task = _pending[key] = asyncio.ensure_future(_refresh(secret, account, rejected))
+        task.add_done_callback(lambda _: _pending.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def _auth_one(secret, auth_url, server_account_id, semaphore, sign):
+    account = Keypair.from_secret(secret).public_key
+    async with semaphore:
+        response = await transport.get(auth_url, idempotent=True, hedged=False, params={'account': account})
+        challenge_xdr = response.json()['transaction']
+    signed_xdr = await sign(challenge_xdr, secret, server_account_id, settings.NETWORK_PASSPHRASE)
+    async with semaphore:
+        response = await transport.post(auth_url, json={'transaction': signed_xdr})
+        return response.json()['token']
+
+
+async def auth_many(secrets, concurrency=None, force=False):
+    """
+    Authenticates the account of each of secrets and stores the tokens in the
+    token cache, for the current anchor and network. Returns one result per
+    secret, in order: {"account", "status": "ok", "cached" or "error",
+    "expires_at" or "error"}.
+
+    Challenges are fetched and signed envelopes posted with at most
+    concurrency (default settings.BATCH_CONCURRENCY) requests at a time,
+    while the challenges are verified against the anchor's SIGNING_KEY and
+    signed in a pool of processes. Accounts with a valid cached token are
+    skipped unless force is True.
+    """
+    results = []
+    pending = {}
+    for secret in secrets:
+        try:
+            account = Keypair.from_secret(secret).public_key
+        except Exception:
+            results.append({'account': None, 'status': 'error', 'error': 'invalid secret'})
+            continue
+        token = None if force else tokens.lookup(secret)
+        if token is not None:
+            results.append({'account': account, 'status': 'cached', 'expires_at': tokens.expires_at(token)})
+        else:
+            results.append({'account': account})
+            pending.setdefault(secret, []).append(results[-1])
+    if not pending:
+        return results
+
+    stellar_toml = await fetch_stellar_toml()
+    auth_url = stellar_toml['WEB_AUTH_ENDPOINT']
+    server_account_id = stellar_toml['SIGNING_KEY']
+    semaphore = asyncio.Semaphore(concurrency or settings.BATCH_CONCURRENCY)
+    loop = asyncio.get_running_loop()
+    workers = min(os.cpu_count() or 1, -(-len(pending) // SIGNATURES_PER_WORKER))
+    # a few signatures aren't worth starting processes, sign them in a thread
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+
+    async def sign(*args):
+        with tracing.span('sign challenge'):
+            return await loop.run_in_executor(executor, verify_and_sign, *args)
+
+    try:
+        outcomes = await asyncio.gather(*[
+            _auth_one(secret, auth_url, server_account_id, semaphore, sign) for secret in pending
+        ], return_exceptions=True)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    new_tokens = {}
+    for (secret, account_results), outcome in zip(pending.items(), outcomes):
+        if isinstance(outcome, Exception):
+            result = {'status': 'error', 'error': f'{outcome.__class__.__name__}: {outcome}'}
+        elif not tokens.is_valid(outcome):
+            result = {'status': 'error', 'error': 'The anchor returned an invalid or expired token'}
+        else:
+            result = {'status': 'ok', 'expires_at': tokens.expires_at(outcome)}
+            new_tokens[secret] = outcome
+        for account_result in account_results:
+            account_result.update(result)
+    if new_tokens:
+        await loop.run_in_executor(None, tokens.update, new_tokens)
+    return results
@@ -0,0 +1,28 @@
+from aio import transport
+from aio.sep1 import fetch_stellar_toml
+from aio.sep10 import get_token
+from utils import urljoin
+
+
+async def _headers(token):
+    return {
+        'Authorization': 'Bearer ' + (token or await get_token())
+    }
+
+
+async def _customer_url():
+    stellar_toml = await fetch_stellar_toml()
+    server = stellar_toml.get('KYC_SERVER')
+    if server is None:
+        server = stellar_toml['TRANSFER_SERVER']
+    return urljoin(server, 'customer')
+
+
+async def customer_get(params: dict, token=None):
+    url = await _customer_url()
+    return (await transport.get(url, idempotent=True, params=params, headers=await _headers(token))).json()
+
+
+async def customer_put(params: dict, token=None):
+    url = await _customer_url()
+    return (await transport.put(url, data=params, headers=await _headers(token))).json()
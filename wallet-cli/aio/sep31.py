@@ -0,0 +1,37 @@
+from aio import transport
+from aio.sep1 import fetch_stellar_toml
+from aio.sep10 import get_token
+from utils import urljoin
+
+
+async def _headers(token):
+    return {
+        'Authorization': 'Bearer ' + (token or await get_token())
+    }
+
+
+async def info():
+    stellar_toml = await fetch_stellar_toml()
+    url = urljoin(stellar_toml['TRANSFER_SERVER_SEP0031'], 'info')
+    return (await transport.get(url, idempotent=True, cached=True)).json()
+
+
+async def transactions_post(payload: dict, token=None):
+    stellar_toml = await fetch_stellar_toml()
+    url = urljoin(stellar_toml['TRANSFER_SERVER_SEP0031'], 'transactions')
+    return (await transport.post(url, json=payload, headers=await _headers(token))).json()
+
+
+async def transactions_get(transaction_id: str, token=None):
+    stellar_toml = await fetch_stellar_toml()
+    url = urljoin(stellar_toml['TRANSFER_SERVER_SEP0031'], 'transactions',
+            transaction_id)
+    return (await transport.get(url, idempotent=True, headers=await _headers(token))).json()
+
+
+async def transactions_patch(transaction_id: str, fields: dict, token=None):
+    stellar_toml = await fetch_stellar_toml()
+    url = urljoin(stellar_toml['TRANSFER_SERVER_SEP0031'], 'transactions',
+            transaction_id)
+    return (await transport.patch(url, json={"fields": fields},
+            headers=await _headers(token))).json()
@@ -0,0 +1,46 @@
+from aio import transport
+from aio.sep1 import fetch_stellar_toml
+from aio.sep10 import get_token
+from utils import urljoin
+
+
+async def _headers(token):
+    return {
+        'Authorization': 'Bearer ' + (token or await get_token())
+    }
+
+
+async def deposit(params, token=None):
+    stellar_toml = await fetch_stellar_toml()
+    url = urljoin(stellar_toml['TRANSFER_SERVER'], 'deposit')
+    return (await transport.get(url, params=params, headers=await _headers(token))).json()
+
+
+async def withdraw(params, token=None):
+    stellar_toml = await fetch_stellar_toml()
+    url = urljoin(stellar_toml['TRANSFER_SERVER'], 'withdraw')
+    return (await transport.get(url, params=params, headers=await _headers(token))).json()
+
+
+async def info(anchor_domain=None):
+    stellar_toml = await fetch_stellar_toml(anchor_domain)
+    url = urljoin(stellar_toml['TRANSFER_SERVER'], 'info')
+    return (await transport.get(url, idempotent=True, cached=True)).json()
+
+
+async def fee(params, anchor_domain=None):
+    stellar_toml = await fetch_stellar_toml(anchor_domain)
+    url = urljoin(stellar_toml['TRANSFER_SERVER'], 'fee')
+    return (await transport.get(url, idempotent=True, cached=True, params=params)).json()
+
+
+async def transaction(params, token=None):
+    stellar_toml = await fetch_stellar_toml()
+    url = urljoin(stellar_toml['TRANSFER_SERVER'], 'transaction')
+    return (await transport.get(url, idempotent=True, params=params, headers=await _headers(token))).json()
+
+
+async def transactions(params, token=None):
+    stellar_toml = await fetch_stellar_toml()
+    url = urljoin(stellar_toml['TRANSFER_SERVER'], 'transactions')
+    return (await transport.get(url, idempotent=True, params=params, headers=await _headers(token))).json()
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import time
+import aiohttp
+import resilience
+import settings
+import tracing
+import transport
+
+_sessions = {}
+# (event loop, cache key): future of the request fetching it
+_flights = {}
+
+
+class Response:
+
+    def __init__(self, status_code, headers, text, error=None):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+        self._error = error
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self._error is not None:
+            raise self._error
+
+
+def session():
+    """
+    Returns the session of the running event loop, creating it on first use.
+    """
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=settings.HTTP_ASYNC_LIMIT,
+            limit_per_host=settings.HTTP_POOL_MAXSIZE,
+            ttl_dns_cache=settings.DNS_TTL,
+        )
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=settings.HTTP_CONNECT_TIMEOUT,
+            sock_read=settings.HTTP_READ_TIMEOUT,
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            headers={'Accept-Encoding': 'gzip, deflate'},
+            trace_configs=tracing.trace_configs(),
+        )
+        _sessions[loop] = session
+    return session
+
+
+async def close():
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+async def _send(method, url, kwargs):
+    resilience.before(url)
+    response = None
+    cancelled = False
+    start = time.perf_counter()
+    try:
+        async with session().request(method, url, **kwargs) as resp:
+            text = await resp.text()
+            try:
+                resp.raise_for_status()
+                error = None
+            except aiohttp.ClientResponseError as e:
+                error = e
+        response = Response(resp.status, resp.headers, text, error)
+        return response
+    except asyncio.CancelledError:
+        cancelled = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        if cancelled:
+            # the other request of a hedged pair answered first
+            resilience.release(url)
+        else:
+            resilience.after(url, elapsed, resilience.is_failure(getattr(response, 'status_code', None)))
+            for hook in transport.HOOKS:
+                hook(method, url, response, elapsed)
+
+
+def _is_good(task):
+    return task.exception() is None and not resilience.is_retryable(task.result().status_code)
+
+
+async def _hedged(method, url, kwargs):
+    """
+    Sends the request, and a duplicate if no answer came within the hedge
+    delay. Returns the first good answer, else the last one; the other
+    request is cancelled.
+    """
+    delay = resilience.hedge_delay(url)
+    if not settings.HTTP_HEDGE_DELAY or delay is None:
+        return await _send(method, url, kwargs)
+    pending = {asyncio.ensure_future(_send(method, url, kwargs))}
+    try:
+        # cancelling the caller here must cancel the request too
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if not done:
+            pending.add(asyncio.ensure_future(_send(method, url, kwargs)))
+        while pending:
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            done |= finished
+            for task in finished:
+                if _is_good(task):
+                    return task.result()
+        return done.pop().result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _resilient(method, url, kwargs, hedged=True):
+    for attempt in range(settings.HTTP_IDEMPOTENT_RETRIES + 1):
+        last = attempt == settings.HTTP_IDEMPOTENT_RETRIES
+        retry_after = None
+        try:
+            response = await (_hedged(method, url, kwargs) if hedged else _send(method, url, kwargs))
+        except resilience.CircuitOpenError:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if last:
+                raise
+        else:
+            if last or not resilience.is_retryable(response.status_code):
+                return response
+            retry_after = response.headers.get('Retry-After')
+        await asyncio.sleep(resilience.backoff(attempt, retry_after))
+
+
+def _stored_response(entry):
+    return Response(entry['status'], entry['headers'], entry['body'].decode())
+
+
+async def _cached(method, url, idempotent, hedged, kwargs):
+    import httpcache
+    cache_key = httpcache.key(url, kwargs.get('params'))
+    entry = httpcache.lookup(cache_key)
+    if entry is not None and entry['expires'] > time.time():
+        return _stored_response(entry)
+
+    # concurrent misses of the same response share the first one's request
+    loop = asyncio.get_running_loop()
+    flight = _flights.get((loop, cache_key))
+    while flight is not None:
+        await asyncio.wait({flight})
+        if not flight.cancelled():
+            return flight.result()
+        flight = _flights.get((loop, cache_key))
+    flight = _flights[(loop, cache_key)] = loop.create_future()
+    try:
+        response = await _fetch(method, url, idempotent, hedged, kwargs, cache_key, entry)
+        flight.set_result(response)
+        return response
+    except asyncio.CancelledError:
+        # the waiting requests send their own
+        flight.cancel()
+        raise
+    except Exception as e:
+        flight.set_exception(e)
+        # raised here, and to the waiting requests if any
+        flight.exception()
+        raise
+    finally:
+        del _flights[(loop, cache_key)]
+
+
+async def _fetch(method, url, idempotent, hedged, kwargs, cache_key, entry):
+    """
+    Fetches or revalidates the stale or missing entry of cache_key.
+    """
+    import httpcache
+    if entry is not None and entry['etag']:
+        kwargs = dict(kwargs, headers=dict(kwargs.get('headers') or {}, **{'If-None-Match': entry['etag']}))
+
+    response = await (_resilient(method, url, kwargs, hedged) if idempotent else _send(method, url, kwargs))
+    if response.status_code == 304 and entry is not None:
+        httpcache.revalidated(cache_key, response.headers)
+        return _stored_response(entry)
+    if response.status_code == 200:
+        httpcache.store(cache_key, response.status_code, response.headers, response.text.encode())
+    return response
+
+
+async def request(method, url, idempotent=False, cached=False, hedged=True, **kwargs):
+    # responses depending on who asks are never shared
+    if cached and method == 'GET' and 'Authorization' not in (kwargs.get('headers') or {}):
+        return await _cached(method, url, idempotent, hedged, kwargs)
+    if idempotent:
+        return await _resilient(method, url, kwargs, hedged)
+    return await _send(method, url, kwargs)
+
+
+async def get(url, **kwargs):
+    return await request('GET', url, **kwargs)
+
+
+async def post(url, **kwargs):
+    return await request('POST', url, **kwargs)
+
+
+async def put(url, **kwargs):
+    return await request('PUT', url, **kwargs)
+
+
+async def patch(url, **kwargs):
+    return await request('PATCH', url, **kwargs)
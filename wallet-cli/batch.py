@@ -0,0 +1,123 @@
+"""
+Runs many SEP operations from one process.
+
+Each input line is a JSON object such as
+
+    {"id": "a1", "op": "sep24 transaction", "params": {"id": "..."}}
+
+where "op" is one of OPERATIONS, "params" holds the same parameters the SEP
+function takes, and the optional "token" overrides the cached SEP-10 token.
+One JSON result line is written per operation, in completion order.
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import fees
+import settings
+import sep1
+import sep6
+import sep10
+import sep12
+import sep24
+import sep31
+import trust
+
+
+def _compare_fees(params, token):
+    import compare
+    return compare.run(params['anchors'], params.get('sep', 'sep24'), params.get('operation', 'deposit'),
+                       params['asset_code'], params['amount'], params.get('type'), params.get('timeout'))
+
+
+def _sep6_deposit(params, token):
+    params.setdefault('account', settings.PUBKEY)
+    return sep6.deposit(params, token)
+
+
+OPERATIONS = {
+    'sep1 fetch_stellar_toml': lambda params, token: sep1.fetch_stellar_toml(),
+    'trust change_trust': lambda params, token: trust.change_trust(
+        params['asset_code'], params['issuer'], params.get('limit')),
+    'sep6 info': lambda params, token: sep6.info(),
+    'sep6 fee': lambda params, token: fees.fee(
+        'sep6', params['operation'], params['asset_code'], params['amount'], params.get('type')),
+    'sep6 deposit': _sep6_deposit,
+    'sep6 withdraw': sep6.withdraw,
+    'sep6 transaction': sep6.transaction,
+    'sep6 transactions': sep6.transactions,
+    'sep10 auth': lambda params, token: sep10.auth(),
+    'sep12 get': sep12.customer_get,
+    'sep12 put': sep12.customer_put,
+    'sep24 info': lambda params, token: sep24.info(),
+    'sep24 fee': lambda params, token: fees.fee(
+        'sep24', params['operation'], params['asset_code'], params['amount'], params.get('type')),
+    'sep24 deposit': sep24.deposit,
+    'sep24 withdraw': sep24.withdraw,
+    'sep24 transaction': sep24.transaction,
+    'sep24 transactions': sep24.transactions,
+    'sep31 info': lambda params, token: sep31.info(),
+    'sep31 create_transaction': sep31.transactions_post,
+    'sep31 get_transaction': lambda params, token: sep31.transactions_get(
+        params['transaction_id'], token),
+    'sep31 patch_transaction': lambda params, token: sep31.transactions_patch(
+        params['transaction_id'], params['fields'], token),
+    'compare fees': _compare_fees,
+}
+
+# operations submitting Stellar transactions from the wallet account must not
+# run concurrently, they would use the same sequence number
+SERIAL_OPERATIONS = {'trust change_trust'}
+_serial_lock = threading.Lock()
+
+
+def run_operation(op, params=None, token=None):
+    """
+    Runs the operation named op (a key of OPERATIONS) and returns its result.
+    """
+    if op not in OPERATIONS:
+        raise ValueError(f'Unknown operation "{op}"')
+    params = dict(params or {})
+    if op in SERIAL_OPERATIONS:
+        with _serial_lock:
+            return OPERATIONS[op](params, token)
+    return OPERATIONS[op](params, token)
+
+
+def _execute(number, line):
+    result = {'line': number}
+    try:
+        operation = json.loads(line)
+        result['id'] = operation.get('id')
+        result['op'] = operation['op']
+        result['result'] = run_operation(operation['op'], operation.get('params'),
+                operation.get('token'))
+        result['status'] = 'ok'
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = f'{type(e).__name__}: {e}'
+    return result
+
+
+def _write(out, futures):
+    for future in futures:
+        out.write(json.dumps(future.result(), default=str) + '\n')
+    out.flush()
+
+
+def run(lines, out, concurrency=settings.BATCH_CONCURRENCY):
+    """
+    Runs the operations read from lines with at most concurrency of them in
+    flight, writing each result to out as soon as it completes.
+    """
+    with ThreadPoolExecutor(concurrency) as executor:
+        pending = set()
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            if len(pending) >= concurrency * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _write(out, done)
+            pending.add(executor.submit(_execute, number, line))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            _write(out, done)
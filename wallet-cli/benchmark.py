@@ -0,0 +1,160 @@
+"""
+Offline benchmarks of the wallet against mockanchor.py.
+
+Each scenario runs against a fresh mock anchor and Horizon in this process,
+with empty stellar.toml, token and account caches in a temporary directory,
+and reports the wall time, the HTTP round trips per operation counted by
+the mock, and the p50/p99 latency of the operations:
+
+    python benchmark.py deposit
+    python benchmark.py status --count 1000 --concurrency 16 --latency 20
+    python benchmark.py payout --count 200 --json
+
+Scenarios:
+    deposit  one cold SEP-6 deposit (stellar.toml, SEP-10 auth, deposit)
+    status   count SEP-24 transaction status lookups
+    payout   count SEP-31 transactions created and paid from the wallet, the
+             latencies are those of the SEP-31 requests
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from stellar_sdk.keypair import Keypair
+from mockanchor import ASSET_CODE, MockAnchor
+import settings
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def _run(function, count, concurrency):
+    """
+    Calls function(i) for i in range(count), concurrency at a time, and
+    returns the latency of each call.
+    """
+    with ThreadPoolExecutor(concurrency) as executor:
+        return list(executor.map(lambda i: _timed(function, i), range(count)))
+
+
+def deposit(server, args):
+    import sep6
+    return [_timed(sep6.deposit, {'asset_code': ASSET_CODE, 'account': settings.PUBKEY, 'amount': 100})]
+
+
+def status(server, args):
+    import sep24
+    from tokens import get_token
+    token = get_token()
+    server.reset_counts()
+    return _run(lambda i: sep24.transaction({'id': f'benchmark-{i}'}, token), args.count, args.concurrency)
+
+
+def payout(server, args):
+    import payments
+    import sep31
+    from tokens import get_token
+    token = get_token()
+    server.reset_counts()
+    issuer = Keypair.random().public_key
+    created = []
+
+    def create(i):
+        created.append(sep31.transactions_post({
+            'amount': 10,
+            'asset_code': ASSET_CODE,
+            'fields': {'transaction': {
+                'receiver_routing_number': '121000358',
+                'receiver_account_number': '000123456789',
+                'type': 'SEPA',
+            }},
+        }, token))
+
+    latencies = _run(create, args.count, args.concurrency)
+    results = payments.send(payments.anchor_item(t, '10', ASSET_CODE, issuer) for t in created)
+    failed = [result for result in results if result['status'] != 'ok']
+    if failed:
+        raise RuntimeError(f'{len(failed)} payments failed: {failed[0]}')
+    return latencies
+
+
+SCENARIOS = {
+    'deposit': deposit,
+    'status': status,
+    'payout': payout,
+}
+
+
+def benchmark(scenario, args):
+    server = MockAnchor(latency=args.latency / 1000, error_rate=args.error_rate,
+                        slow_rate=args.slow_rate, slow_latency=args.slow_latency / 1000).start()
+    with tempfile.TemporaryDirectory() as directory:
+        settings.CACHE_DIR = os.path.join(directory, 'cache')
+        settings.TOKENS_DIR = os.path.join(directory, 'tokens')
+        settings.STELLAR_TOML_SCHEME = 'http'
+        settings.HORIZON_URL = server.url + '/horizon'
+        settings.init(server.domain, 'TESTNET', Keypair.random().secret)
+        try:
+            start = time.perf_counter()
+            latencies = SCENARIOS[scenario](server, args)
+            wall_time = time.perf_counter() - start
+        finally:
+            server.shutdown()
+            server.server_close()
+    operations = 1 if scenario == 'deposit' else args.count
+    return {
+        'scenario': scenario,
+        'operations': operations,
+        'concurrency': args.concurrency,
+        'latency_ms': args.latency,
+        'wall_time_s': round(wall_time, 3),
+        'operations_per_s': round(operations / wall_time, 1),
+        'round_trips_per_operation': round(server.request_count() / operations, 2),
+        'requests': {f'{method} {path}': count for (method, path), count in sorted(server.requests.items())},
+        'p50_ms': round(_percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(_percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline wallet benchmarks')
+    parser.add_argument('scenario', choices=list(SCENARIOS) + ['all'])
+    parser.add_argument('--count', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=settings.BATCH_CONCURRENCY)
+    parser.add_argument('--latency', type=float, default=0, help='milliseconds added by the mock to each response')
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--slow-rate', type=float, default=0,
+                        help='fraction of responses also delayed by --slow-latency')
+    parser.add_argument('--slow-latency', type=float, default=0, help='milliseconds')
+    parser.add_argument('--json', action='store_true', help='print results as JSON lines')
+    args = parser.parse_args()
+
+    scenarios = list(SCENARIOS) if args.scenario == 'all' else [args.scenario]
+    for scenario in scenarios:
+        result = benchmark(scenario, args)
+        if args.json:
+            print(json.dumps(result))
+            continue
+        print(f'{scenario}: {result["operations"]} operations in {result["wall_time_s"]} s '
+              f'({result["operations_per_s"]}/s), {result["round_trips_per_operation"]} round trips '
+              f'per operation, p50 {result["p50_ms"]} ms, p99 {result["p99_ms"]} ms')
+        for request, count in result['requests'].items():
+            print(f'    {count:>8} {request}')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
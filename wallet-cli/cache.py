@@ -0,0 +1,98 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote
+
+import settings
+
+
+def _path(namespace, key):
+    return os.path.join(settings.CACHE_DIR, namespace, quote(key, safe='') + '.json')
+
+
+def load(namespace, key):
+    """
+    Returns the cached entry stored under namespace/key, or None.
+    """
+    try:
+        with open(_path(namespace, key)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def store(namespace, key, entry):
+    """
+    Atomically writes entry (a JSON serializable dict) under namespace/key.
+    """
+    path = _path(namespace, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'w') as file:
+            json.dump(entry, file, default=str)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def max_age(headers, default):
+    """
+    Returns how many seconds a response may be reused, based on its
+    Cache-Control header, else its Expires header. None means it must not
+    be stored at all.
+    """
+    directives = {}
+    for directive in headers.get('Cache-Control', '').split(','):
+        name, _, value = directive.strip().partition('=')
+        directives[name.lower()] = value.strip('"')
+    if 'no-store' in directives:
+        return None
+    if 'no-cache' in directives:
+        return 0
+    try:
+        return int(directives['max-age'])
+    except (KeyError, ValueError):
+        pass
+    if headers.get('Expires'):
+        try:
+            expires = parsedate_to_datetime(headers['Expires']).timestamp()
+            now = parsedate_to_datetime(headers['Date']).timestamp() if headers.get('Date') else time.time()
+        except (TypeError, ValueError):
+            # invalid dates, such as "0", mean already expired
+            return 0
+        return max(int(expires - now), 0)
+    return default
+
+
+def is_fresh(entry):
+    return entry is not None and entry['expires'] > time.time()
+
+
+def namespaces():
+    """
+    Returns {namespace: (entries, size in bytes)} of the cache directory.
+    """
+    result = {}
+    try:
+        names = sorted(os.listdir(settings.CACHE_DIR))
+    except OSError:
+        return result
+    for name in names:
+        path = os.path.join(settings.CACHE_DIR, name)
+        if os.path.isdir(path):
+            files = [os.path.join(path, file) for file in os.listdir(path)]
+            result[name] = (len(files), sum(os.path.getsize(file) for file in files))
+    return result
+
+
+def clear():
+    """
+    Removes every namespace of the cache directory.
+    """
+    for name in namespaces():
+        shutil.rmtree(os.path.join(settings.CACHE_DIR, name), ignore_errors=True)
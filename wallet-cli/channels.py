@@ -0,0 +1,147 @@
+"""
+Channel accounts, used as transaction sources so that many transactions of
+the wallet account can be in flight at the same time.
+
+The channel secrets are stored in the database profile (settings.CHANNELS).
+A transaction takes a free channel as source account, its operations use the
+wallet account as source, and it is signed by both. Each channel is used by
+one transaction at a time, and its sequence number is allocated locally
+from the cached account state, which is reloaded after a failed submission.
+Without channels, the wallet account is the only channel.
+"""
+import queue
+import threading
+from contextlib import contextmanager
+from stellar_sdk.exceptions import BadRequestError, NotFoundError
+from stellar_sdk.keypair import Keypair
+from stellar_sdk.transaction_builder import TransactionBuilder
+import account
+import settings
+import tracing
+
+MAX_OPERATIONS = 100
+
+_available = None
+_stale = set()
+_lock = threading.Lock()
+
+
+class UnknownOutcomeError(Exception):
+    """
+    The transaction was sent but its outcome is unknown (timeout, connection
+    lost, 5xx answer): it may have been applied. hash is its hash, to look
+    it up on Horizon.
+    """
+
+    def __init__(self, hash, cause):
+        super().__init__(f'{type(cause).__name__}: {cause}')
+        self.hash = hash
+
+
+def secrets():
+    return getattr(settings, 'CHANNELS', None) or [settings.SECRET]
+
+
+def _pool():
+    global _available
+    with _lock:
+        if _available is None:
+            _available = queue.Queue()
+            for secret in secrets():
+                _available.put(Keypair.from_secret(secret))
+        return _available
+
+
+def size():
+    return len(secrets())
+
+
+def reset():
+    """
+    Rebuilds the pool on next use, after settings.CHANNELS changed.
+    """
+    global _available
+    with _lock:
+        _available = None
+
+
+@contextmanager
+def acquire():
+    """
+    Waits for a free channel and returns its keypair.
+    """
+    keypair = _pool().get()
+    try:
+        yield keypair
+    finally:
+        _pool().put(keypair)
+
+
+def submit(append_ops, signers=()):
+    """
+    Builds, signs and submits a transaction from a free channel. append_ops
+    is called with the TransactionBuilder to add the operations (using
+    settings.PUBKEY as source) and memo. signers are additional keypairs
+    signing the transaction. On tx_bad_seq the channel sequence number is
+    reloaded and the transaction rebuilt once. Raises BadRequestError when
+    Horizon rejected the transaction, and UnknownOutcomeError when it may
+    have been applied.
+    """
+    wallet = Keypair.from_secret(settings.SECRET)
+    with acquire() as channel:
+        for attempt in range(2):
+            state = account.load(channel.public_key, refresh=channel.public_key in _stale)
+            _stale.discard(channel.public_key)
+            builder = TransactionBuilder(
+                source_account=account.source_account(state),
+                network_passphrase=settings.NETWORK_PASSPHRASE,
+            )
+            append_ops(builder)
+            with tracing.span('sign transaction'):
+                envelope = builder.build()
+                for keypair in {channel.public_key: channel, wallet.public_key: wallet,
+                                **{signer.public_key: signer for signer in signers}}.values():
+                    envelope.sign(keypair)
+            try:
+                response = settings.HORIZON_SERVER.submit_transaction(envelope)
+            except BadRequestError as e:
+                _stale.add(channel.public_key)
+                if attempt == 0 and account.is_bad_seq(e):
+                    continue
+                raise
+            except Exception as e:
+                _stale.add(channel.public_key)
+                raise UnknownOutcomeError(envelope.hash_hex(), e) from e
+            account.applied(state)
+            return response
+
+
+def create(secrets, starting_balance, created=None):
+    """
+    Creates the channel accounts of secrets, funded by the wallet account,
+    MAX_OPERATIONS per transaction. created, if given, is called with the
+    secrets of each transaction's accounts once it succeeded.
+    """
+    for i in range(0, len(secrets), MAX_OPERATIONS):
+        chunk = secrets[i:i + MAX_OPERATIONS]
+
+        def append_ops(builder, chunk=chunk):
+            for secret in chunk:
+                builder.append_create_account_op(Keypair.from_secret(secret).public_key, starting_balance,
+                        source=settings.PUBKEY)
+        submit(append_ops)
+        if created is not None:
+            created(chunk)
+
+
+def missing(secrets):
+    """
+    Returns the secrets of secrets whose account doesn't exist on Horizon.
+    """
+    result = []
+    for secret in secrets:
+        try:
+            account.load(Keypair.from_secret(secret).public_key, refresh=True)
+        except NotFoundError:
+            result.append(secret)
+    return result
@@ -21,29 +21,33 @@ import os
 import os.path
 import sys
 
-from requests.exceptions import RequestException
-from stellar_sdk.exceptions import Ed25519SecretSeedInvalidError
-from stellar_sdk.keypair import Keypair
 from termcolor import colored, cprint
 
-import database
-import sep1
-import trust
-import sep6
-import sep10
-import sep12
-import sep24
-import sep31
 import settings
 
+# Only the modules needed by the selected option are imported, see the
+# "Startup time" section of the README.
+
 
 PARSERS = {}
+# (password, data) of the profile loaded by load_database()
+_loaded = None
 
 
-def argparser():
+def argparser(argv=None):
+    """
+    Builds the argument parser. Only the subparser of the option selected in
+    argv (default sys.argv) gets its operations and arguments.
+    """
     parser = argparse.ArgumentParser(description='Wallet CLI')
     parser.add_argument('-e', '--env', action='store_true',
             help='get database password from WALLET_CLI_PASSWORD environment variable')
+    parser.add_argument('-p', '--profile', default=os.getenv('WALLET_CLI_PROFILE', 'default'),
+            help='database profile to use, defaults to WALLET_CLI_PROFILE or "default"')
+    parser.add_argument('--trace', action='store_true',
+            help='print the HTTP requests and local phases of the command as a waterfall on stderr')
+    parser.add_argument('--trace-file', metavar='PATH',
+            help='write the trace of the command as JSON to PATH')
     option_subparsers = parser.add_subparsers(help='option', dest='_option')
 
     def add_database_parser():
@@ -80,6 +84,65 @@ def argparser():
         change_trust_parser.add_argument('--limit')
         PARSERS['trust']['change_trust'] = change_trust_parser
 
+        sync_parser = trust_subparsers.add_parser('sync')
+        sync_parser.add_argument(
+            '--manifest',
+            required=True,
+            help='JSON file listing the desired trustlines. '
+                 'Ex: [{"asset_code": "USDC", "issuer": "G...", "limit": "1000"}]'
+        )
+        sync_parser.add_argument('--prune', action='store_true',
+                help='also remove the trustlines missing from the manifest and having a zero balance')
+        PARSERS['trust']['sync'] = sync_parser
+
+    def add_channels_parser():
+        channels_parser = option_subparsers.add_parser('channels')
+        PARSERS['channels'] = {}
+        PARSERS['channels']['_'] = channels_parser
+        channels_subparsers = channels_parser.add_subparsers(description='operations', dest='_operation')
+
+        create_parser = channels_subparsers.add_parser('create')
+        create_parser.add_argument('--count', type=int, required=True)
+        create_parser.add_argument('--starting-balance', default='2',
+                help='XLM sent to each channel account')
+        PARSERS['channels']['create'] = create_parser
+
+        list_parser = channels_subparsers.add_parser('list')
+        PARSERS['channels']['list'] = list_parser
+
+    def add_pay_parser():
+        pay_parser = option_subparsers.add_parser('pay')
+        PARSERS['pay'] = {}
+        PARSERS['pay']['_'] = pay_parser
+        pay_subparsers = pay_parser.add_subparsers(description='operations', dest='_operation')
+
+        send_parser = pay_subparsers.add_parser('send')
+        send_parser.add_argument('--destination', required=True)
+        send_parser.add_argument('--amount', required=True)
+        send_parser.add_argument('--asset-code', default='XLM')
+        send_parser.add_argument('--issuer', help='required if asset code is not XLM')
+        send_parser.add_argument('--memo')
+        send_parser.add_argument('--memo-type', choices=['text', 'id', 'hash', 'return'])
+        PARSERS['pay']['send'] = send_parser
+
+        anchor_parser = pay_subparsers.add_parser('anchor')
+        anchor_parser.add_argument('--sep', required=True, choices=['sep6', 'sep24', 'sep31'])
+        anchor_parser.add_argument('--transaction-id', required=True)
+        anchor_parser.add_argument('--asset-code', required=True)
+        anchor_parser.add_argument('--issuer', required=True)
+        anchor_parser.add_argument('--amount', help="defaults to the transaction's amount_in")
+        anchor_parser.add_argument('--token', help='SEP10 auth token')
+        PARSERS['pay']['anchor'] = anchor_parser
+
+        batch_parser = pay_subparsers.add_parser('batch')
+        batch_parser.add_argument(
+            '--file',
+            required=True,
+            help='JSONL file of payments. Ex: {"id": "1", "destination": "G...", '
+                 '"amount": "10", "asset_code": "USDC", "asset_issuer": "G..."}'
+        )
+        PARSERS['pay']['batch'] = batch_parser
+
     def add_sep6_parser():
         sep6_parser = option_subparsers.add_parser('sep6')
         PARSERS['sep6'] = {}
@@ -159,6 +222,14 @@ def argparser():
         auth_parser = sep10_subparsers.add_parser('auth')
         PARSERS['sep10']['auth'] = auth_parser
 
+        auth_many_parser = sep10_subparsers.add_parser('auth_many')
+        auth_many_parser.add_argument('--file', default='-',
+                                      help='file with one account secret per line, "-" for stdin')
+        auth_many_parser.add_argument('--concurrency', type=int, default=settings.BATCH_CONCURRENCY)
+        auth_many_parser.add_argument('--force', action='store_true',
+                                      help='authenticate accounts which have a valid cached token too')
+        PARSERS['sep10']['auth_many'] = auth_many_parser
+
     def add_sep12_parser():
         sep12_parser = option_subparsers.add_parser('sep12')
         PARSERS['sep12'] = {}
@@ -181,9 +252,21 @@ def argparser():
             required=True,
             help='Parameters as a JSON string. Ex: {"memo": "MEMO1234"}'
         )
+        put_parser.add_argument('--file', action='append', default=[], metavar='FIELD=PATH',
+                                help='binary field uploaded from a file, ex: photo_id_front=id.jpg')
         put_parser.add_argument('--token', help='SEP10 auth token')
         PARSERS['sep12']['put'] = put_parser
 
+        put_many_parser = sep12_subparsers.add_parser('put_many')
+        put_many_parser.add_argument(
+            '--file',
+            default='-',
+            help='JSONL file of customers, "-" for stdin. '
+                 'Ex: {"id": "1", "params": {"account": "G..."}, "files": {"photo_id_front": "id.jpg"}}'
+        )
+        put_many_parser.add_argument('--concurrency', type=int, default=settings.BATCH_CONCURRENCY)
+        PARSERS['sep12']['put_many'] = put_many_parser
+
     def add_sep24_parser():
         sep24_parser = option_subparsers.add_parser('sep24')
         PARSERS['sep24'] = {}
@@ -258,38 +341,212 @@ def argparser():
         patch_transaction_parser.add_argument('--fields', help='fields as a JSON string', required=True)
         PARSERS['sep31']['patch_transaction'] = patch_transaction_parser
 
+        payout_parser = sep31_subparsers.add_parser('payout')
+        payout_parser.add_argument(
+            '--file',
+            required=True,
+            help='CSV or JSONL file of transactions, each with a unique id. '
+                 'CSV columns: id, amount, asset_code, '
+                 'sender_id, receiver_id and fields as category.field, '
+                 'ex: transaction.receiver_account_number'
+        )
+        payout_parser.add_argument('--format', choices=['csv', 'jsonl'],
+                                   help='defaults to the file extension')
+        payout_parser.add_argument('--journal', help='defaults to FILE.journal')
+        payout_parser.add_argument('--concurrency', type=int, default=settings.BATCH_CONCURRENCY)
+        payout_parser.add_argument('--rate', type=float, default=settings.PAYOUT_RATE,
+                                   help='transactions created per second, 0 for no limit')
+        PARSERS['sep31']['payout'] = payout_parser
+
+    def add_history_parser():
+        history_parser = option_subparsers.add_parser('history')
+        PARSERS['history'] = {}
+        PARSERS['history']['_'] = history_parser
+        history_subparsers = history_parser.add_subparsers(description='operations', dest='_operation')
+
+        sync_parser = history_subparsers.add_parser('sync')
+        sync_parser.add_argument('--sep', required=True, choices=['sep6', 'sep24'])
+        sync_parser.add_argument('--asset-code', required=True, action='append',
+                help='can be repeated')
+        sync_parser.add_argument('--full', action='store_true',
+                help='fetch the whole history instead of the changes since the last sync')
+        sync_parser.add_argument('--token', help='SEP10 auth token')
+        PARSERS['history']['sync'] = sync_parser
+
+        query_parser = history_subparsers.add_parser('query')
+        query_parser.add_argument('--sep', choices=['sep6', 'sep24'])
+        query_parser.add_argument('--status')
+        query_parser.add_argument('--kind')
+        query_parser.add_argument('--asset-code')
+        query_parser.add_argument('--since', help='started_at lower bound (ISO 8601, inclusive)')
+        query_parser.add_argument('--until', help='started_at upper bound (ISO 8601, exclusive)')
+        query_parser.add_argument('--stellar-transaction-id')
+        query_parser.add_argument('--limit', type=int)
+        PARSERS['history']['query'] = query_parser
+
+    def add_watch_parser():
+        watch_parser = option_subparsers.add_parser('watch')
+        PARSERS['watch'] = {}
+        PARSERS['watch']['_'] = watch_parser
+        watch_subparsers = watch_parser.add_subparsers(description='operations', dest='_operation')
+
+        transactions_parser = watch_subparsers.add_parser('transactions')
+        transactions_parser.add_argument('--sep', required=True, choices=['sep6', 'sep24', 'sep31'])
+        transactions_parser.add_argument('--id', action='append', help='can be repeated')
+        transactions_parser.add_argument('--file', help='file with one transaction id per line')
+        transactions_parser.add_argument('--timeout', type=float, help='seconds to watch for')
+        transactions_parser.add_argument('--token', help='SEP10 auth token')
+        PARSERS['watch']['transactions'] = transactions_parser
+
+        deposits_parser = watch_subparsers.add_parser('deposits')
+        deposits_parser.add_argument('--sep', action='append', choices=['sep6', 'sep24'],
+                                     help='SEPs of the deposits to match, can be repeated, defaults to both')
+        deposits_parser.add_argument('--count', type=int, help='stop after this many matched deposits')
+        PARSERS['watch']['deposits'] = deposits_parser
+
+    def add_batch_parser():
+        batch_parser = option_subparsers.add_parser('batch')
+        PARSERS['batch'] = {}
+        PARSERS['batch']['_'] = batch_parser
+        batch_subparsers = batch_parser.add_subparsers(description='operations', dest='_operation')
+
+        run_parser = batch_subparsers.add_parser('run')
+        run_parser.add_argument(
+            '--file',
+            default='-',
+            help='JSONL file of operations, "-" for stdin. '
+                 'Ex: {"id": "1", "op": "sep24 transaction", "params": {"id": "..."}}'
+        )
+        run_parser.add_argument('--concurrency', type=int, default=settings.BATCH_CONCURRENCY)
+        PARSERS['batch']['run'] = run_parser
 
-    add_database_parser()
-    add_sep1_parser()
-    add_trust_parser()
-    add_sep6_parser()
-    add_sep10_parser()
-    add_sep12_parser()
-    add_sep24_parser()
-    add_sep31_parser()
+    def add_export_parser():
+        export_parser = option_subparsers.add_parser('export')
+        PARSERS['export'] = {}
+        PARSERS['export']['_'] = export_parser
+        export_subparsers = export_parser.add_subparsers(description='operations', dest='_operation')
+
+        transactions_parser = export_subparsers.add_parser('transactions')
+        transactions_parser.add_argument('--sep', required=True, choices=['sep6', 'sep24'])
+        transactions_parser.add_argument('--asset-code', required=True)
+        transactions_parser.add_argument('--kind', choices=['deposit', 'withdrawal'])
+        transactions_parser.add_argument('--no-older-than', help='UTC ISO 8601 string')
+        transactions_parser.add_argument('--page-size', type=int, default=settings.HISTORY_PAGE_SIZE)
+        transactions_parser.add_argument('--format', default='ndjson', choices=['ndjson', 'csv'])
+        transactions_parser.add_argument('--output', default='-', help='file to write, "-" for stdout')
+        transactions_parser.add_argument('--token', help='SEP10 auth token')
+        PARSERS['export']['transactions'] = transactions_parser
+
+    def add_cache_parser():
+        cache_parser = option_subparsers.add_parser('cache')
+        PARSERS['cache'] = {}
+        PARSERS['cache']['_'] = cache_parser
+        cache_subparsers = cache_parser.add_subparsers(description='operations', dest='_operation')
+
+        stats_parser = cache_subparsers.add_parser('stats')
+        PARSERS['cache']['stats'] = stats_parser
+
+        clear_parser = cache_subparsers.add_parser('clear')
+        PARSERS['cache']['clear'] = clear_parser
+
+    def add_compare_parser():
+        compare_parser = option_subparsers.add_parser('compare')
+        PARSERS['compare'] = {}
+        PARSERS['compare']['_'] = compare_parser
+        compare_subparsers = compare_parser.add_subparsers(description='operations', dest='_operation')
+
+        fees_parser = compare_subparsers.add_parser('fees')
+        fees_parser.add_argument('--anchors', nargs='+', required=True, help='anchor domains to compare')
+        fees_parser.add_argument('--sep', default='sep24', choices=['sep6', 'sep24'])
+        fees_parser.add_argument('--operation', default='deposit', choices=['deposit', 'withdraw'])
+        fees_parser.add_argument('--asset-code', required=True)
+        fees_parser.add_argument('--amount', type=float, required=True)
+        fees_parser.add_argument('--type', help='deposit or withdraw type, ex: SEPA')
+        fees_parser.add_argument('--timeout', type=float, default=settings.COMPARE_TIMEOUT,
+                help='seconds each anchor has to answer')
+        PARSERS['compare']['fees'] = fees_parser
+
+    builders = {
+        'database': add_database_parser,
+        'sep1': add_sep1_parser,
+        'trust': add_trust_parser,
+        'channels': add_channels_parser,
+        'pay': add_pay_parser,
+        'sep6': add_sep6_parser,
+        'sep10': add_sep10_parser,
+        'sep12': add_sep12_parser,
+        'sep24': add_sep24_parser,
+        'sep31': add_sep31_parser,
+        'history': add_history_parser,
+        'watch': add_watch_parser,
+        'batch': add_batch_parser,
+        'compare': add_compare_parser,
+        'export': add_export_parser,
+        'cache': add_cache_parser,
+    }
+    option = None
+    argv = iter(sys.argv[1:] if argv is None else argv)
+    for arg in argv:
+        if arg in ['-p', '--profile', '--trace-file']:
+            next(argv, None)
+        elif not arg.startswith('-'):
+            option = arg
+            break
+    for name, add_parser in builders.items():
+        if name == option:
+            add_parser()
+        else:
+            option_subparsers.add_parser(name)
+    option_subparsers.add_parser('shell', help='run commands in an interactive shell')
+    if option == 'serve':
+        serve_parser = option_subparsers.add_parser('serve', help='run operations for local processes over HTTP')
+        serve_parser.add_argument('--port', type=int, default=8400)
+        serve_parser.add_argument('--host', default='127.0.0.1',
+                                  help='loopback address to listen on')
+        serve_parser.add_argument('--socket', help='listen on this Unix socket instead of a port')
+        serve_parser.add_argument('--concurrency', type=int, default=settings.BATCH_CONCURRENCY)
+        serve_parser.add_argument('--verbose', action='store_true', help='log each request to stderr')
+        PARSERS['serve'] = {'_': serve_parser}
+    else:
+        option_subparsers.add_parser('serve', help='run operations for local processes over HTTP')
 
     return parser
 
 
-def load_database(env=False):
-    if not os.path.isfile(settings.DATABASE_PATH):
-        print(colored('Database file does not exist. Use the "python cli.py database create" to create it.', 'yellow'))
-        sys.exit(1)
-    elif env:
+def get_password(env=False):
+    if env:
         pw = os.getenv('WALLET_CLI_PASSWORD')
         if pw is None:
             error('Environment variable WALLET_CLI_PASSWORD is required '
                     'when using the -e/--env option')
-    else:
-        pw = None
+        return pw
+    return getpass(magenta('Database password: '))
+
+
+def load_database(env=False, profile='default'):
+    """
+    Asks for the password, loads the profile in settings and returns the
+    password and the profile data, kept in _loaded for the shell commands.
+    """
+    global _loaded
+    if not os.path.isfile(settings.DATABASE_PATH):
+        print(colored('Database file does not exist. Use the "python cli.py database create" to create it.', 'yellow'))
+        sys.exit(1)
 
+    import database
+    pw = get_password(env)
     try:
-        if pw is None:
-            pw = getpass(magenta('Database password: '))
-        data = database.read(pw)
-        settings.init(data['anchor_domain'], data['stellar_network'], data['secret'])
+        data = database.read(pw, profile)
+        settings.init(data['anchor_domain'], data['stellar_network'], data['secret'],
+                data.get('account'))
+        settings.PROFILE = profile
+        settings.CHANNELS = data.get('channels', [])
+    except KeyError:
+        error(f'Profile "{profile}" does not exist')
     except ValueError:
         error('Password is incorrect or database is corrupted')
+    _loaded = pw, data
+    return _loaded
 
 
 def pp(obj):
@@ -311,20 +568,125 @@ def error(message, parser=None):
     sys.exit(1)
 
 
+def traced(args, function, *function_args):
+    """
+    Calls function, tracing it when args has --trace or --trace-file.
+    """
+    if not (args.trace or args.trace_file):
+        return function(*function_args)
+    import tracing
+    tracing.enable()
+    try:
+        return function(*function_args)
+    finally:
+        tracing.report(args.trace_file)
+
+
+def shell(shell_args):
+    """
+    Reads commands from stdin and runs them in this process, so the database,
+    stellar.toml, SEP-10 token and HTTP connections stay loaded between them.
+    With --trace or --trace-file, each command is traced.
+    """
+    import shlex
+    import time
+    try:
+        import readline  # noqa: F401, enables line editing and history
+    except ImportError:
+        pass
+
+    print('Type a command, ex: "sep24 transaction --id ID", "help" or "exit".')
+    while True:
+        try:
+            line = input('wallet> ')
+        except EOFError:
+            print()
+            break
+        except KeyboardInterrupt:
+            print()
+            continue
+
+        try:
+            argv = shlex.split(line)
+        except ValueError as e:
+            print_red(str(e))
+            continue
+        if not argv:
+            continue
+        if argv[0] in ['exit', 'quit']:
+            break
+        if argv[0] == 'help':
+            argv = argv[1:] + ['--help']
+        if argv[0] in ['database', 'shell', 'serve']:
+            print_red(f'{argv[0]} is not available in the shell')
+            continue
+
+        start = time.perf_counter()
+        try:
+            args = argparser(argv).parse_args(argv)
+            args.trace = args.trace or shell_args.trace
+            args.trace_file = args.trace_file or shell_args.trace_file
+            check_args(args)
+            traced(args, run, args)
+        except SystemExit:
+            pass
+        except KeyboardInterrupt:
+            print_red('Interrupted')
+        except Exception as e:
+            print_red(f'{type(e).__name__}: {e}')
+        cprint('{:.0f} ms'.format((time.perf_counter() - start) * 1000), 'white', attrs=['dark'])
+
+
+def check_args(args):
+    if not args._option:
+        error('No option provided')
+    if not getattr(args, '_operation', None):
+        error('No operation provided', PARSERS[args._option]['_'])
+
+
 def main():
     parser = argparser()
     args = parser.parse_args()
 
-    if not args._option:
-        error('No option provided')
-    if not args._operation:
-        error('No operation provided', PARSERS[args._option]['_'])
+    if args._option == 'shell':
+        load_database(args.env, args.profile)
+        shell(args)
+        return
+
+    if args._option == 'serve':
+        import gateway
+        if args.concurrency < 1:
+            error('--concurrency must be at least 1', PARSERS['serve']['_'])
+        if not args.socket and not gateway.is_loopback(args.host):
+            error('--host must be a loopback address, the gateway has no authentication',
+                    PARSERS['serve']['_'])
+        load_database(args.env, args.profile)
+        gateway.serve(args.port, args.host, args.socket, args.concurrency, args.verbose)
+        return
+
+    check_args(args)
+    traced(args, load_and_run, args)
+
+
+def load_and_run(args):
+    # compare only queries public endpoints of the given anchors
+    if args._option not in ['database', 'compare', 'cache'] or args._operation == 'list':
+        load_database(args.env, args.profile)
+    run(args)
+
 
+def run(args):
     if args._option == 'database':
         if args._operation == 'create':
+            from requests.exceptions import RequestException
+            from stellar_sdk.exceptions import Ed25519SecretSeedInvalidError
+            from stellar_sdk.keypair import Keypair
+            import database
+            import sep1
+
             print('The database is an encrypted file named '
-                  + colored(settings.DATABASE_NAME, 'yellow', attrs=['bold']) + ', and it\'s'
-                  ' used to store these values:')
+                  + colored(settings.DATABASE_NAME, 'yellow', attrs=['bold']) + ', and each'
+                  ' of its profiles stores these values:')
             print('- Anchor domain')
             print('- Stellar network')
             print('- Stellar account secret key')
@@ -332,28 +694,34 @@ def main():
                   ' on the screen while you type them.')
 
             if os.path.isfile(settings.DATABASE_PATH):
-                cprint(
-                    'Database file {} already exists, do you want to override '
-                    'it? (y/N) '.format(settings.DATABASE_NAME),
-                    'yellow',
-                    attrs=['bold'],
-                    end='',
-                )
-                answer = input().strip()
-                if answer not in ['y', 'Y']:
-                    error('')
-
-            while True:
-                pw = getpass(magenta('New database password: '))
-                confirm_pw = getpass(magenta('Repeat new database password: '))
-                if pw != confirm_pw:
-                    print_red('Passwords mismatch')
-                    continue
-                break
+                if args.profile in database.profiles():
+                    cprint(
+                        'Profile {} already exists, do you want to override '
+                        'it? (y/N) '.format(args.profile),
+                        'yellow',
+                        attrs=['bold'],
+                        end='',
+                    )
+                    answer = input().strip()
+                    if answer not in ['y', 'Y']:
+                        error('')
+                pw = get_password(args.env)
+                try:
+                    database.check(pw)
+                except ValueError:
+                    error('Password is incorrect or database is corrupted')
+            else:
+                while True:
+                    pw = getpass(magenta('New database password: '))
+                    confirm_pw = getpass(magenta('Repeat new database password: '))
+                    if pw != confirm_pw:
+                        print_red('Passwords mismatch')
+                        continue
+                    break
             while True:
                 secret = getpass(colored('Stellar account secret key: ', 'magenta', attrs=['bold']))
                 try:
-                    Keypair.from_secret(secret)
+                    account = Keypair.from_secret(secret).public_key
                 except Ed25519SecretSeedInvalidError:
                     print_red('Invalid secret key')
                     continue
@@ -382,50 +750,160 @@ def main():
 
             data = {
                 'anchor_domain': anchor_domain,
+                'account': account,
                 'secret': secret,
                 'stellar_network': stellar_network,
             }
-            database.write(pw, data)
+            database.write(pw, data, args.profile)
             print()
-            cprint('Successfully created database.bin', 'green', attrs=['bold'])
+            cprint('Successfully created profile {} in {}'.format(args.profile, settings.DATABASE_NAME),
+                   'green', attrs=['bold'])
 
 
         elif args._operation == 'delete':
+            import database
             try:
-                os.remove(settings.DATABASE_PATH)
+                database.remove(args.profile)
+                if not database.profiles():
+                    database.destroy()
             except FileNotFoundError:
                 error('Database file does not exist')
+            except KeyError:
+                error(f'Profile "{args.profile}" does not exist')
 
         elif args._operation == 'list':
-            load_database(args.env)
+            import database
+            cprint('Profiles:', 'white', attrs=['bold'])
+            for profile in database.profiles():
+                print((' * ' if profile == args.profile else '   ') + profile)
             cprint('Database:', 'white', attrs=['bold'])
+            print(' Profile: ' + args.profile)
             print(' Anchor domain: ' + settings.ANCHOR_DOMAIN)
             print(' Stellar Network: ' + settings.STELLAR_NETWORK)
             print(' Account: ' + settings.PUBKEY)
-    else:
-        load_database(args.env)
 
     if args._option == 'sep1':
+        import sep1
         if args._operation == 'fetch_stellar_toml':
             pp(sep1.fetch_stellar_toml())
 
     elif args._option == 'trust':
+        import trust
         if args._operation == 'change_trust':
             pp(trust.change_trust(args.asset_code, args.issuer, args.limit))
 
+        elif args._operation == 'sync':
+            try:
+                with open(args.manifest) as file:
+                    desired = json.load(file)
+            except OSError as e:
+                error(str(e))
+            except JSONDecodeError:
+                error('manifest must be a JSON file', PARSERS['trust']['sync'])
+            pp(trust.sync(desired, args.prune))
+
+    elif args._option == 'channels':
+        import channels
+        if args._operation == 'create':
+            from stellar_sdk.keypair import Keypair
+            import database
+            if args.count < 1:
+                error('--count must be at least 1', PARSERS['channels']['create'])
+
+            # the secrets are stored as unfunded before the accounts are
+            # funded, so they can't be lost, and only used as channels once
+            # their account exists. Those of a failed run are checked on
+            # Horizon, then funded again if their account is missing.
+            pw, data = _loaded
+            data.setdefault('channels', [])
+            unfunded = data.get('unfunded_channels', [])
+            still_unfunded = channels.missing(unfunded)
+            funded = [secret for secret in unfunded if secret not in still_unfunded]
+            data['channels'] += funded
+            reused = still_unfunded[:args.count]
+            secrets = reused + [Keypair.random().secret for _ in range(args.count - len(reused))]
+            data['unfunded_channels'] = still_unfunded + secrets[len(reused):]
+            database.write(pw, data, settings.PROFILE)
+
+            def created(chunk):
+                funded.extend(chunk)
+                data['channels'] += chunk
+                data['unfunded_channels'] = [
+                    secret for secret in data['unfunded_channels'] if secret not in chunk]
+                database.write(pw, data, settings.PROFILE)
+
+            try:
+                channels.create(secrets, args.starting_balance, created)
+            except Exception:
+                print(f'{len(data["unfunded_channels"])} channel accounts are not funded, they are '
+                      'kept and checked again by the next "channels create"', file=sys.stderr)
+                raise
+            finally:
+                settings.CHANNELS = data['channels']
+                channels.reset()
+            for secret in funded:
+                print(Keypair.from_secret(secret).public_key)
+
+        elif args._operation == 'list':
+            from stellar_sdk.keypair import Keypair
+            for secret in settings.CHANNELS:
+                print(Keypair.from_secret(secret).public_key)
+
+    elif args._option == 'pay':
+        import payments
+        if args._operation == 'send':
+            if args.asset_code != 'XLM' and not args.issuer:
+                error('Missing required argument --issuer', PARSERS['pay']['send'])
+            pp(payments.send([{
+                'destination': args.destination,
+                'amount': args.amount,
+                'asset_code': args.asset_code,
+                'asset_issuer': args.issuer,
+                'memo': args.memo,
+                'memo_type': args.memo_type,
+            }])[0])
+
+        elif args._operation == 'anchor':
+            if args.sep == 'sep6':
+                import sep6
+                transaction = sep6.transaction({'id': args.transaction_id}, args.token)['transaction']
+            elif args.sep == 'sep24':
+                import sep24
+                transaction = sep24.transaction({'id': args.transaction_id}, args.token)['transaction']
+            else:
+                import sep31
+                transaction = sep31.transactions_get(args.transaction_id, args.token)['transaction']
+            amount = args.amount or transaction.get('amount_in')
+            if not amount:
+                error('Missing required argument --amount', PARSERS['pay']['anchor'])
+            try:
+                item = payments.anchor_item(transaction, amount, args.asset_code, args.issuer)
+            except ValueError as e:
+                error(str(e))
+            pp(payments.send([item])[0])
+
+        elif args._operation == 'batch':
+            try:
+                with open(args.file) as file:
+                    items = [json.loads(line) for line in file if line.strip()]
+            except OSError as e:
+                error(str(e))
+            except JSONDecodeError:
+                error('file must contain one JSON object per line', PARSERS['pay']['batch'])
+            for result in payments.send(items):
+                print(json.dumps(result))
+
     elif args._option == 'sep6':
+        import sep6
         if args._operation == 'info':
             pp(sep6.info())
 
         elif args._operation == 'fee':
-            params = {
-                'operation': args.operation,
-                'asset_code': args.asset_code,
-                'amount': args.amount,
-            }
-            if args.type:
-                params['type'] = args.type
-            pp(sep6.fee(params))
+            import fees
+            try:
+                pp(fees.fee('sep6', args.operation, args.asset_code, args.amount, args.type))
+            except ValueError as e:
+                error(str(e))
 
         elif args._operation == 'deposit':
             params = {
@@ -451,7 +929,10 @@ def main():
             if args.partner_ref:
                 params['partner_ref'] = args.partner_ref
 
-            pp(sep6.deposit(params, args.token))
+            try:
+                pp(sep6.deposit(params, args.token))
+            except ValueError as e:
+                error(str(e))
 
         elif args._operation == 'withdraw':
             params = {
@@ -489,7 +970,10 @@ def main():
             if args.external_memo:
                 params['external_memo'] = args.external_memo
 
-            pp(sep6.withdraw(params, args.token))
+            try:
+                pp(sep6.withdraw(params, args.token))
+            except ValueError as e:
+                error(str(e))
 
         elif args._operation == 'transaction':
             params = {}
@@ -520,10 +1004,26 @@ def main():
             pp(sep6.transactions(params, args.token))
 
     elif args._option == 'sep10':
+        import sep10
         if args._operation == 'auth':
             print(sep10.auth())
 
+        elif args._operation == 'auth_many':
+            if args.concurrency < 1:
+                error('--concurrency must be at least 1', PARSERS['sep10']['auth_many'])
+            if args.file == '-':
+                secrets = [line.strip() for line in sys.stdin if line.strip()]
+            else:
+                try:
+                    with open(args.file) as file:
+                        secrets = [line.strip() for line in file if line.strip()]
+                except OSError as e:
+                    error(str(e))
+            for result in sep10.auth_many(secrets, args.concurrency, args.force):
+                print(json.dumps(result))
+
     elif args._option == 'sep12':
+        import sep12
         if args._operation == 'get':
             params = {}
             if args.id:
@@ -545,22 +1045,45 @@ def main():
                 params = json.loads(args.data)
             except (JSONDecodeError, TypeError):
                 error('data must be a JSON string', PARSERS['sep12']['put'])
+            files = {}
+            for file_arg in args.file:
+                field, _, path = file_arg.partition('=')
+                if not field or not path:
+                    error('--file must be FIELD=PATH', PARSERS['sep12']['put'])
+                files[field] = path
 
-            pp(sep12.customer_put(params, args.token))
+            try:
+                pp(sep12.customer_put(params, args.token, files))
+            except OSError as e:
+                error(str(e))
+
+        elif args._operation == 'put_many':
+            if args.concurrency < 1:
+                error('--concurrency must be at least 1', PARSERS['sep12']['put_many'])
+            try:
+                if args.file == '-':
+                    items = [json.loads(line) for line in sys.stdin if line.strip()]
+                else:
+                    with open(args.file) as file:
+                        items = [json.loads(line) for line in file if line.strip()]
+            except OSError as e:
+                error(str(e))
+            except JSONDecodeError:
+                error('file must contain one JSON object per line', PARSERS['sep12']['put_many'])
+            for result in sep12.customer_put_many(items, args.concurrency):
+                print(json.dumps(result), flush=True)
 
     elif args._option == 'sep24':
+        import sep24
         if args._operation == 'info':
             pp(sep24.info())
 
         elif args._operation == 'fee':
-            params = {
-                'operation': args.operation,
-                'asset_code': args.asset_code,
-                'amount': args.amount,
-            }
-            if args.type:
-                params['type'] = args.type
-            pp(sep24.fee(params))
+            import fees
+            try:
+                pp(fees.fee('sep24', args.operation, args.asset_code, args.amount, args.type))
+            except ValueError as e:
+                error(str(e))
 
         elif args._operation == 'deposit':
             try:
@@ -568,7 +1091,10 @@ def main():
             except (JSONDecodeError, TypeError):
                 error('data must be a JSON string', PARSERS['sep24']['deposit'])
 
-            pp(sep24.deposit(params, args.token))
+            try:
+                pp(sep24.deposit(params, args.token))
+            except ValueError as e:
+                error(str(e))
 
         elif args._operation == 'withdraw':
             try:
@@ -576,7 +1102,10 @@ def main():
             except (JSONDecodeError, TypeError):
                 error('data must be a JSON string', PARSERS['sep24']['withdraw'])
 
-            pp(sep24.withdraw(params, args.token))
+            try:
+                pp(sep24.withdraw(params, args.token))
+            except ValueError as e:
+                error(str(e))
 
         elif args._operation == 'transaction':
             params = {}
@@ -607,6 +1136,7 @@ def main():
             pp(sep24.transactions(params, args.token))
 
     elif args._option == 'sep31':
+        import sep31
         if args._operation == 'info':
             pp(sep31.info())
 
@@ -620,19 +1150,128 @@ def main():
                     payload['fields'] = json.loads(args.fields)
                 except (JSONDecodeError, TypeError):
                     error('fields must be a JSON string', PARSERS['sep31']['create_transaction'])
-            pp(sep31.transactions_post(payload))
+            try:
+                pp(sep31.transactions_post(payload))
+            except ValueError as e:
+                error(str(e))
 
         elif args._operation == 'get_transaction':
             pp(sep31.transactions_get(args.transaction_id))
 
         elif args._operation == 'patch_transaction':
             try:
-                payload = {
-                    'fields': json.loads(args.fields)
-                }
+                fields = json.loads(args.fields)
             except (JSONDecodeError, TypeError):
                 error('fields must be a JSON string', PARSERS['sep31']['patch_transaction'])
-            pp(sep31.transactions_patch(args.transaction_id, payload))
+            pp(sep31.transactions_patch(args.transaction_id, fields))
+
+        elif args._operation == 'payout':
+            import payouts
+            if args.concurrency < 1:
+                error('--concurrency must be at least 1', PARSERS['sep31']['payout'])
+            format = args.format or ('csv' if args.file.lower().endswith('.csv') else 'jsonl')
+            try:
+                with open(args.file, newline='') as file:
+                    counts = payouts.run(payouts.read_rows(file, format), args.journal or args.file + '.journal',
+                                         sys.stdout, args.concurrency, args.rate)
+            except OSError as e:
+                error(str(e))
+            except (JSONDecodeError, KeyError, ValueError) as e:
+                error(f'{args.file}: {e}')
+            print(', '.join(f'{count} {state}' for state, count in sorted(counts.items())), file=sys.stderr)
+
+    elif args._option == 'history':
+        import history
+        if args._operation == 'sync':
+            for asset_code in args.asset_code:
+                count = history.sync(args.sep, asset_code, args.token, args.full)
+                print(f'{asset_code}: {count} transactions synced')
+
+        elif args._operation == 'query':
+            pp(history.query(
+                sep=args.sep,
+                status=args.status,
+                kind=args.kind,
+                asset_code=args.asset_code,
+                since=args.since,
+                until=args.until,
+                stellar_transaction_id=args.stellar_transaction_id,
+                limit=args.limit,
+            ))
+
+    elif args._option == 'watch':
+        import watch
+        if args._operation == 'transactions':
+            transaction_ids = list(args.id or [])
+            if args.file:
+                try:
+                    with open(args.file) as file:
+                        transaction_ids.extend(line.strip() for line in file if line.strip())
+                except OSError as e:
+                    error(str(e))
+            if not transaction_ids:
+                error('An argument is required', PARSERS['watch']['transactions'])
+            watch.run(transaction_ids, sys.stdout, args.sep, args.token, args.timeout)
+
+        elif args._operation == 'deposits':
+            import deposits
+            try:
+                deposits.listen(sys.stdout, args.sep or ['sep6', 'sep24'], args.count)
+            except KeyboardInterrupt:
+                pass
+
+    elif args._option == 'batch':
+        import batch
+        if args._operation == 'run':
+            if args.concurrency < 1:
+                error('--concurrency must be at least 1', PARSERS['batch']['run'])
+            if args.file == '-':
+                batch.run(sys.stdin, sys.stdout, args.concurrency)
+            else:
+                try:
+                    with open(args.file) as file:
+                        batch.run(file, sys.stdout, args.concurrency)
+                except OSError as e:
+                    error(str(e))
+
+    elif args._option == 'export':
+        import export
+        if args._operation == 'transactions':
+            params = {'asset_code': args.asset_code, 'limit': args.page_size}
+            if args.kind:
+                params['kind'] = args.kind
+            if args.no_older_than:
+                params['no_older_than'] = args.no_older_than
+            records = export.transactions(args.sep, params, args.token)
+            if args.output == '-':
+                export.write(records, sys.stdout, args.format)
+            else:
+                try:
+                    with open(args.output, 'w', newline='') as file:
+                        count = export.write(records, file, args.format)
+                except OSError as e:
+                    error(str(e))
+                print(f'{count} transactions written to {args.output}')
+
+    elif args._option == 'cache':
+        import cache
+        import httpcache
+        if args._operation == 'stats':
+            stats = {'http': httpcache.stats()}
+            for namespace, (entries, size) in cache.namespaces().items():
+                stats[namespace] = {'entries': entries, 'size': size}
+            pp(stats)
+
+        elif args._operation == 'clear':
+            httpcache.clear()
+            cache.clear()
+            print('Cache cleared')
+
+    elif args._option == 'compare':
+        import compare
+        if args._operation == 'fees':
+            pp(compare.run(args.anchors, args.sep, args.operation, args.asset_code,
+                           args.amount, args.type, args.timeout))
 
 
 if __name__ == '__main__':
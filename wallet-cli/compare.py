@@ -0,0 +1,110 @@
+"""
+Compares the deposit or withdraw terms of several anchors for an asset and
+amount.
+
+The stellar.toml and /info of every anchor are fetched at the same time with
+the asyncio API, and /fee is only called for anchors whose /info doesn't
+give fee_fixed or fee_percent. Each anchor has its own deadline, so a slow or
+broken anchor is reported as an error without delaying the others. Results
+are ranked by fee among the anchors able to handle the request.
+"""
+import asyncio
+import time
+import fees
+import settings
+
+
+async def _quote(anchor_domain, sep, operation, asset_code, amount, type):
+    from aio import sep6, sep24
+    module = {'sep6': sep6, 'sep24': sep24}[sep]
+
+    info = await module.info(anchor_domain)
+    asset = info.get(operation, {}).get(asset_code)
+    if not asset or not asset.get('enabled'):
+        raise ValueError(f'{operation} of {asset_code} is not enabled')
+
+    fee = fees.compute(asset, amount)
+    fee_source = 'info'
+    if fee is None and info.get('fee', {}).get('enabled'):
+        params = {'operation': operation, 'asset_code': asset_code, 'amount': amount}
+        if type is not None:
+            params['type'] = type
+        fee = float((await module.fee(params, anchor_domain))['fee'])
+        fee_source = 'fee'
+    elif fee is None:
+        fee_source = None
+
+    min_amount = asset.get('min_amount')
+    max_amount = asset.get('max_amount')
+    types = sorted(asset.get('types', {}))
+    return {
+        'fee': fee,
+        'fee_source': fee_source,
+        'amount_out': round(amount - fee, 7) if fee is not None else None,
+        'min_amount': min_amount,
+        'max_amount': max_amount,
+        'types': types,
+        'in_limits': ((min_amount is None or amount >= float(min_amount))
+                      and (max_amount is None or amount <= float(max_amount))),
+        'type_supported': type is None or not types or type in types,
+    }
+
+
+async def _compare_anchor(anchor_domain, sep, operation, asset_code, amount, type, timeout):
+    start = time.perf_counter()
+    result = {'anchor_domain': anchor_domain}
+    try:
+        result.update(await asyncio.wait_for(
+            _quote(anchor_domain, sep, operation, asset_code, amount, type), timeout))
+    except asyncio.TimeoutError:
+        result['error'] = f'no answer within {timeout} s'
+    except Exception as e:
+        result['error'] = f'{e.__class__.__name__}: {e}'
+    result['elapsed'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def _usable(result):
+    return ('error' not in result and result['fee'] is not None
+            and result['in_limits'] and result['type_supported'])
+
+
+def rank(results):
+    """
+    Sorts results by fee, anchors which can't handle the request last, and
+    numbers the usable ones from 1.
+    """
+    results = sorted(results, key=lambda r: (not _usable(r), r.get('fee') or 0, r['anchor_domain']))
+    for position, result in enumerate(results, 1):
+        result['rank'] = position if _usable(result) else None
+    return results
+
+
+async def compare(anchor_domains, sep, operation, asset_code, amount, type=None, timeout=None):
+    """
+    Returns the ranked terms of each of anchor_domains for a deposit or
+    withdraw (operation) of amount asset_code, through sep ("sep6" or
+    "sep24"). type is the deposit or withdraw type, ex: "SEPA".
+    """
+    timeout = timeout if timeout is not None else settings.COMPARE_TIMEOUT
+    amount = float(amount)
+    results = await asyncio.gather(*[
+        _compare_anchor(anchor_domain, sep, operation, asset_code, amount, type, timeout)
+        for anchor_domain in dict.fromkeys(anchor_domains)
+    ])
+    return rank(results)
+
+
+def run(anchor_domains, sep, operation, asset_code, amount, type=None, timeout=None):
+    """
+    compare() for callers without an event loop.
+    """
+    import aio
+
+    async def _run():
+        try:
+            return await compare(anchor_domains, sep, operation, asset_code, amount, type, timeout)
+        finally:
+            await aio.close()
+
+    return asyncio.run(_run())
@@ -1,18 +1,241 @@
+"""
+Encrypted keystore holding one record per profile.
+
+database.bin starts with MAGIC, followed by append-only records:
+
+    4 bytes header length | cleartext JSON header | encrypted payload
+
+The header only holds the profile name and payload size, never profile data.
+Each payload is encrypted on its own, so unlocking a profile decrypts a single
+record. Adding or updating a profile appends a record, and removing one
+appends a header with "deleted": true.
+
+database.bin.idx is an SQLite index mapping each profile to the offset and
+size of its latest payload, so a lookup is one indexed query and one seek
+whatever the number of profiles. It is updated in a transaction after each
+append, and rebuilt from the record headers when it doesn't cover the whole
+file (ex: after a crash between both writes). A record cut short by a crash
+during its append is ignored, and removed by the next write.
+
+Files without MAGIC use the former format, a single encrypted JSON object,
+which is read as the DEFAULT_PROFILE.
+"""
+import fcntl
 import json
+import os
+import sqlite3
+import struct
+from contextlib import closing, contextmanager
 from Crypto.Cipher import AES
 from Crypto.Hash import SHA256
 from Crypto import Random
 from settings import DATABASE_PATH
+import tracing
+
+MAGIC = b'WALLETCLI-KEYSTORE-1\n'
+DEFAULT_PROFILE = 'default'
+INDEX_PATH = DATABASE_PATH + '.idx'
+
+
+@contextmanager
+def _locked(file):
+    fcntl.flock(file, fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def _is_legacy(file):
+    file.seek(0)
+    return file.read(len(MAGIC)) != MAGIC
+
+
+def _header(file, offset, size):
+    """
+    Returns the header of the record at offset and the offset of its
+    payload, or None if the record doesn't end before size.
+    """
+    file.seek(offset)
+    try:
+        header_size = struct.unpack('>I', file.read(4))[0]
+        if offset + 4 + header_size > size:
+            return None
+        header = json.loads(file.read(header_size).decode())
+        payload_offset = offset + 4 + header_size
+        if 'profile' not in header or not (header.get('deleted') or 'size' in header):
+            return None
+        if payload_offset + header.get('size', 0) > size:
+            return None
+    except (struct.error, ValueError, AttributeError):
+        return None
+    return header, payload_offset
+
+
+def _scan(file, connection, repair=False):
+    """
+    Rebuilds the index by reading every record header, up to the last
+    complete record. If repair, the file is truncated after it.
+    """
+    profiles = {}
+    offset = len(MAGIC)
+    size = file.seek(0, os.SEEK_END)
+    while offset < size:
+        record = _header(file, offset, size)
+        if record is None:
+            break
+        header, offset = record
+        if header.get('deleted'):
+            profiles.pop(header['profile'], None)
+        else:
+            profiles[header['profile']] = (offset, header['size'])
+        offset += header.get('size', 0)
+    if offset < size and repair:
+        file.truncate(offset)
+        os.fsync(file.fileno())
+    # a torn record left in place keeps the index stale, so the next write
+    # repairs the file before appending
+    size = offset
+    with connection:
+        connection.execute('DELETE FROM profiles')
+        connection.execute('DELETE FROM meta')
+        connection.executemany('INSERT INTO profiles VALUES (?, ?, ?)',
+                               [(name,) + value for name, value in profiles.items()])
+        connection.execute('INSERT INTO meta VALUES (?)', (size,))
+
+
+def _index(file, repair=False):
+    """
+    Returns a connection to the index of file, rebuilding it if it is stale.
+    repair must only be set by writers holding the lock, see _scan().
+    """
+    connection = sqlite3.connect(INDEX_PATH)
+    with connection:
+        connection.execute('CREATE TABLE IF NOT EXISTS profiles '
+                           '(name TEXT PRIMARY KEY, offset INTEGER, size INTEGER)')
+        connection.execute('CREATE TABLE IF NOT EXISTS meta (size INTEGER)')
+    row = connection.execute('SELECT size FROM meta').fetchone()
+    if row is None or row[0] != file.seek(0, os.SEEK_END):
+        _scan(file, connection, repair)
+    return connection
+
+
+def _append(file, connection, profile, payload=None):
+    offset = file.seek(0, os.SEEK_END)
+    header = {'profile': profile}
+    if payload is None:
+        header['deleted'] = True
+    else:
+        header['size'] = len(payload)
+    header = json.dumps(header).encode()
+    file.write(struct.pack('>I', len(header)) + header + (payload or b''))
+    file.flush()
+    os.fsync(file.fileno())
+    with connection:
+        if payload is None:
+            connection.execute('DELETE FROM profiles WHERE name = ?', (profile,))
+        else:
+            connection.execute('INSERT OR REPLACE INTO profiles VALUES (?, ?, ?)',
+                               (profile, offset + 4 + len(header), len(payload)))
+        connection.execute('UPDATE meta SET size = ?', (file.tell(),))
+
+
+def _migrate(file):
+    """
+    Rewrites a database of the former format as a keystore whose
+    DEFAULT_PROFILE is the former encrypted content.
+    """
+    file.seek(0)
+    payload = file.read()
+    tmp_path = DATABASE_PATH + '.tmp'
+    with open(tmp_path, 'wb+') as tmp_file:
+        tmp_file.write(MAGIC)
+        with closing(_index(tmp_file)) as connection:
+            _append(tmp_file, connection, DEFAULT_PROFILE, payload)
+    os.replace(tmp_path, DATABASE_PATH)
+
+
+def profiles():
+    """
+    Returns the profile names, which are stored in cleartext.
+    """
+    with open(DATABASE_PATH, 'rb') as file:
+        if _is_legacy(file):
+            return [DEFAULT_PROFILE]
+        with closing(_index(file)) as connection:
+            return [row[0] for row in connection.execute('SELECT name FROM profiles ORDER BY name')]
+
+
+def read(key, profile=DEFAULT_PROFILE):
+    """
+    Decrypts and returns the data of profile. Raises KeyError if it doesn't
+    exist and ValueError if key is incorrect.
+    """
+    with open(DATABASE_PATH, 'rb') as file:
+        if _is_legacy(file):
+            if profile != DEFAULT_PROFILE:
+                raise KeyError(profile)
+            file.seek(0)
+            with tracing.span('database decrypt'):
+                return json.loads(decrypt(key.encode(), file.read()).decode())
+        with closing(_index(file)) as connection:
+            row = connection.execute('SELECT offset, size FROM profiles WHERE name = ?',
+                                     (profile,)).fetchone()
+        if row is None:
+            raise KeyError(profile)
+        file.seek(row[0])
+        with tracing.span('database decrypt'):
+            return json.loads(decrypt(key.encode(), file.read(row[1])).decode())
+
+
+def write(key, data, profile=DEFAULT_PROFILE):
+    """
+    Adds or replaces profile, without rewriting the other records.
+    """
+    payload = encrypt(key.encode(), json.dumps(data).encode())
+    with open(DATABASE_PATH, 'ab+') as file, _locked(file):
+        if file.seek(0, os.SEEK_END) == 0:
+            file.write(MAGIC)
+        elif _is_legacy(file):
+            _migrate(file)
+            return write(key, data, profile)
+        with closing(_index(file, repair=True)) as connection:
+            _append(file, connection, profile, payload)
+
+
+def remove(profile):
+    """
+    Removes profile. Raises KeyError if it doesn't exist.
+    """
+    with open(DATABASE_PATH, 'rb+') as file, _locked(file):
+        if _is_legacy(file):
+            _migrate(file)
+            return remove(profile)
+        with closing(_index(file, repair=True)) as connection:
+            if connection.execute('SELECT 1 FROM profiles WHERE name = ?',
+                                  (profile,)).fetchone() is None:
+                raise KeyError(profile)
+            _append(file, connection, profile)
 
 
-def write(key, data):
-    with open('database.bin', 'wb') as file:
-        file.write(encrypt(key.encode(), json.dumps(data).encode()))
+def destroy():
+    """
+    Deletes the database and its index.
+    """
+    os.remove(DATABASE_PATH)
+    try:
+        os.remove(INDEX_PATH)
+    except FileNotFoundError:
+        pass
 
 
-def read(key):
-    with open('database.bin', 'rb') as file:
-        return json.loads(decrypt(key.encode(), file.read()).decode())
+def check(key):
+    """
+    Raises ValueError if key doesn't decrypt the existing profiles.
+    """
+    names = profiles()
+    if names:
+        read(key, names[0])
 
 
 def encrypt(key: bytes, source: bytes):
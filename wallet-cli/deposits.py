@@ -0,0 +1,162 @@
+"""
+Detects SEP-6 and SEP-24 deposits when their payment lands on the account.
+
+listen() follows the account's payments on Horizon as server-sent events,
+with the paying transaction joined for its memo, instead of polling the
+anchor. Each payment received is matched to a pending deposit of the local
+index (see history.py): same asset code and deposit memo or, for deposits
+without memo, the only pending deposit of the asset with that amount. The
+matched deposit is then looked up once at the anchor and stored with the
+payment's transaction hash. A payment matching no known deposit syncs the
+asset's deposits from the anchor first, unless they were synced after the
+payment was made: that sync already listed every deposit the payment can
+pay. The stream position is saved after each event,
+so a restarted listener resumes where it stopped, see sse.py for
+reconnections.
+"""
+import importlib
+import json
+import sys
+import time
+from datetime import datetime, timezone
+import history
+import settings
+import sse
+import transport
+from utils import urljoin
+
+PAYMENT_TYPES = {'payment', 'path_payment', 'path_payment_strict_receive', 'path_payment_strict_send'}
+# seconds of clock difference tolerated between Horizon and this host
+CLOCK_SKEW = 5
+
+# (sep, asset_code): time.time() at which the last successful sync started
+_synced = {}
+
+
+def _amount(record):
+    amount = record.get('amount_out') or record.get('amount_in')
+    try:
+        return round(float(amount), 7)
+    except (TypeError, ValueError):
+        return None
+
+
+def match(payment, deposits):
+    """
+    Returns the item of deposits, (sep, asset_code, record), paid by a
+    Horizon payment record, or None.
+    """
+    asset_code = 'XLM' if payment.get('asset_type') == 'native' else payment.get('asset_code')
+    candidates = [deposit for deposit in deposits if deposit[1] == asset_code
+                  and deposit[2].get('to') in (None, payment.get('to'))]
+    memo = (payment.get('transaction') or {}).get('memo')
+    if memo is not None:
+        for deposit in candidates:
+            if deposit[2].get('deposit_memo') is not None and str(deposit[2]['deposit_memo']) == str(memo):
+                return deposit
+    amount = round(float(payment['amount']), 7)
+    by_amount = [deposit for deposit in candidates
+                 if deposit[2].get('deposit_memo') is None and _amount(deposit[2]) == amount]
+    return by_amount[0] if len(by_amount) == 1 else None
+
+
+def _timestamp(created_at):
+    try:
+        return datetime.strptime(created_at[:19], '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _sync(sep, asset_code, paid_at):
+    synced_at = _synced.get((sep, asset_code))
+    if synced_at is not None and paid_at is not None and paid_at < synced_at - CLOCK_SKEW:
+        return
+    started_at = time.time()
+    try:
+        history.sync(sep, asset_code)
+    except Exception as e:
+        print(f'Could not sync {sep} {asset_code} deposits: {type(e).__name__}: {e}', file=sys.stderr)
+    else:
+        _synced[(sep, asset_code)] = started_at
+
+
+def _completed(payment, seps):
+    deposits = [deposit for deposit in history.pending('deposit') if deposit[0] in seps]
+    found = match(payment, deposits)
+    if found is None:
+        # the deposit may have been started after the last sync
+        asset_code = 'XLM' if payment.get('asset_type') == 'native' else payment.get('asset_code')
+        for sep in seps:
+            _sync(sep, asset_code, _timestamp(payment.get('created_at')))
+        deposits = [deposit for deposit in history.pending('deposit') if deposit[0] in seps]
+        found = match(payment, deposits)
+        for sep in seps:
+            if found is not None:
+                break
+            # or already completed by the anchor
+            for record in history.query(sep=sep, kind='deposit', asset_code=asset_code,
+                                        stellar_transaction_id=payment.get('transaction_hash')):
+                return sep, asset_code, record
+    if found is None:
+        return None
+
+    sep, asset_code, record = found
+    try:
+        record = importlib.import_module(sep).transaction({'id': record['id']})['transaction']
+    except Exception:
+        pass
+    if not record.get('stellar_transaction_id'):
+        record['stellar_transaction_id'] = payment.get('transaction_hash')
+    history.save(sep, asset_code, [record])
+    return sep, asset_code, record
+
+
+def _start_cursor(url):
+    """
+    Returns the paging token of the account's last payment, so the first
+    listen() doesn't miss payments received while it reconnects.
+    """
+    response = transport.get(url, idempotent=True, params={'order': 'desc', 'limit': 1})
+    response.raise_for_status()
+    records = response.json()['_embedded']['records']
+    return records[0]['paging_token'] if records else '0'
+
+
+def listen(out, seps=('sep6', 'sep24'), count=None):
+    """
+    Writes a JSON line to out for each payment received by the account: the
+    deposit it completes, or "matched": false. Returns after count matched
+    payments, if given.
+    """
+    account = settings.PUBKEY
+    horizon_url = settings.HORIZON_SERVER.horizon_url
+    url = urljoin(horizon_url, 'accounts', account, 'payments')
+    stream = f'{horizon_url}|{account}|payments'
+    cursor = history.cursor(stream) or _start_cursor(url)
+    matched = 0
+    for event in sse.events(url, {'join': 'transactions', 'cursor': cursor}, cursor):
+        try:
+            payment = json.loads(event['data'])
+        except ValueError:
+            payment = None
+        if isinstance(payment, dict) and payment.get('to') == account and payment.get('type') in PAYMENT_TYPES:
+            result = {
+                'paging_token': payment.get('paging_token'),
+                'stellar_transaction_id': payment.get('transaction_hash'),
+                'asset_code': payment.get('asset_code', 'XLM'),
+                'amount': payment.get('amount'),
+                'memo': (payment.get('transaction') or {}).get('memo'),
+                'matched': False,
+            }
+            found = _completed(payment, seps)
+            if found is not None:
+                sep, asset_code, record = found
+                result.update(matched=True, sep=sep, id=record['id'], status=record.get('status'))
+                matched += 1
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+        if event['id'] is not None and event['id'] != cursor:
+            cursor = event['id']
+            history.save_cursor(stream, cursor)
+        if count is not None and matched >= count:
+            return
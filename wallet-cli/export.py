@@ -0,0 +1,142 @@
+"""
+Streams every SEP-6 or SEP-24 transaction of an asset as NDJSON or CSV.
+
+Pages of the anchor's /transactions endpoint are read as they arrive: the
+response body is decoded record by record (JSONDecoder.raw_decode over the
+received chunks), so the first records are written before the page is
+complete and memory doesn't grow with the page or history size. Pages are
+fetched by a reader thread which asks for the next page (paging_id of the
+last record) as soon as the current one is read, while the records are still
+being written. Both sides share a bounded queue.
+"""
+import codecs
+import csv
+import json
+import queue
+import re
+import threading
+import settings
+import transport
+from sep1 import fetch_stellar_toml
+from tokens import get_token
+from utils import urljoin
+
+TRANSFER_SERVERS = {
+    'sep6': 'TRANSFER_SERVER',
+    'sep24': 'TRANSFER_SERVER_SEP0024',
+}
+CSV_COLUMNS = ['id', 'kind', 'status', 'amount_in', 'amount_out', 'amount_fee', 'started_at',
+               'completed_at', 'stellar_transaction_id', 'external_transaction_id']
+CHUNK_SIZE = 64 * 1024
+# records buffered between the reader thread and the writer
+QUEUE_SIZE = 1000
+
+_ARRAY_START = re.compile(r'"transactions"\s*:\s*\[')
+_DONE = object()
+
+
+def iter_array(chunks, pattern=_ARRAY_START):
+    """
+    Yields the items of the JSON array starting at pattern in the document
+    made of the text chunks, as soon as each item is complete.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = None
+    for chunk in chunks:
+        buffer += chunk
+        if position is None:
+            match = pattern.search(buffer)
+            if match is None:
+                continue
+            position = match.end()
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                break
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                # incomplete item, wait for the next chunk
+                break
+            yield item
+        buffer = buffer[position:]
+        position = 0
+    if position is not None:
+        raise ValueError('The response ended in the middle of the transactions')
+
+
+def _text(response):
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')()
+    for chunk in response.iter_content(CHUNK_SIZE):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+def _pages(sep, params, token, records):
+    """
+    Puts every record into the records queue, page after page, then _DONE
+    (or the exception which stopped the export).
+    """
+    try:
+        url = urljoin(fetch_stellar_toml()[TRANSFER_SERVERS[sep]], 'transactions')
+        headers = {'Authorization': 'Bearer ' + (token or get_token())}
+        params = dict(params)
+        while True:
+            last_id = None
+            with transport.get(url, params=params, headers=headers, stream=True) as response:
+                response.raise_for_status()
+                for record in iter_array(_text(response)):
+                    records.put(record)
+                    last_id = record.get('id')
+            if last_id is None or last_id == params.get('paging_id'):
+                break
+            params['paging_id'] = last_id
+        records.put(_DONE)
+    except Exception as e:
+        records.put(e)
+
+
+def transactions(sep, params, token=None):
+    """
+    Yields every transaction matching params (asset_code and optional kind,
+    no_older_than and limit, the page size), newest first.
+    """
+    if sep not in TRANSFER_SERVERS:
+        raise ValueError(f'Unsupported SEP "{sep}"')
+    params = dict(params)
+    params.setdefault('limit', settings.HISTORY_PAGE_SIZE)
+    records = queue.Queue(QUEUE_SIZE)
+    threading.Thread(target=_pages, args=(sep, params, token, records), daemon=True).start()
+    while True:
+        record = records.get()
+        if record is _DONE:
+            return
+        if isinstance(record, Exception):
+            raise record
+        yield record
+
+
+def write(records, out, format='ndjson', columns=CSV_COLUMNS):
+    """
+    Writes records to out as NDJSON or CSV and returns how many were
+    written. out is flushed after the first record, then every 100.
+    """
+    writer = None
+    if format == 'csv':
+        writer = csv.DictWriter(out, columns, extrasaction='ignore')
+        writer.writeheader()
+    count = 0
+    for count, record in enumerate(records, 1):
+        if writer is None:
+            out.write(json.dumps(record) + '\n')
+        else:
+            writer.writerow({column: json.dumps(value) if isinstance(value, (dict, list)) else value
+                             for column, value in record.items()})
+        if count == 1 or count % 100 == 0:
+            out.flush()
+    out.flush()
+    return count
@@ -0,0 +1,185 @@
+"""
+Fees and request validation from the anchor's /info.
+
+The SEP-6, SEP-24 and SEP-31 /info responses are compiled into an index of
+the terms of each operation and asset (enabled, fee_fixed, fee_percent,
+fee_minimum, min_amount, max_amount, fields and types). /info is read
+through the HTTP cache (see httpcache.py), which decides when it is fetched
+again, and compiled again only when it changed. Fees are computed
+from it without any request, and /fee is only called when the anchor
+publishes no fee terms for the asset but enables /fee (dynamic fees).
+validate() checks deposit, withdraw and SEP-31 transaction params against
+the same index, so invalid requests fail before reaching the anchor.
+"""
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+import settings
+
+# (anchor domain|sep): (/info response, its index)
+_INDEXES = {}
+
+
+def _key(sep):
+    return f'{settings.ANCHOR_DOMAIN}|{sep}'
+
+
+def _fields(fields):
+    return {
+        name: {'optional': bool(spec.get('optional')), 'choices': spec.get('choices')}
+        for name, spec in (fields or {}).items()
+    }
+
+
+def compile_info(sep, info):
+    """
+    Returns the index of an /info response of sep.
+    """
+    index = {'fee_endpoint': bool(info.get('fee', {}).get('enabled')), 'operations': {}}
+    for operation in ['receive'] if sep == 'sep31' else ['deposit', 'withdraw']:
+        assets = index['operations'][operation] = {}
+        for asset_code, asset in info.get(operation, {}).items():
+            terms = {name: asset.get(name) for name in
+                     ['fee_fixed', 'fee_percent', 'fee_minimum', 'min_amount', 'max_amount']}
+            terms['enabled'] = bool(asset.get('enabled'))
+            if sep == 'sep31':
+                terms['fields'] = {category: _fields(fields)
+                                   for category, fields in asset.get('fields', {}).items()}
+            else:
+                terms['fields'] = _fields(asset.get('fields'))
+            terms['types'] = {name: _fields(spec.get('fields'))
+                              for name, spec in asset.get('types', {}).items()}
+            assets[asset_code] = terms
+    return index
+
+
+def index(sep):
+    """
+    Returns the index of the current anchor's /info for sep ("sep6", "sep24"
+    or "sep31").
+    """
+    key = _key(sep)
+    info = importlib.import_module(sep).info()
+    entry = _INDEXES.get(key)
+    if entry is None or entry[0] != info:
+        entry = _INDEXES[key] = (info, compile_info(sep, info))
+    return entry[1]
+
+
+def terms(sep, operation, asset_code):
+    """
+    Returns the indexed terms of operation for asset_code. Raises ValueError
+    if the anchor doesn't enable it.
+    """
+    asset = index(sep)['operations'].get(operation, {}).get(asset_code)
+    if asset is None or not asset['enabled']:
+        raise ValueError(f'{operation} of {asset_code} is not enabled by the anchor')
+    return asset
+
+
+def compute(terms, amount):
+    """
+    Returns the fee of amount from terms (an /info asset or its indexed
+    terms), or None if they don't give fee_fixed or fee_percent.
+    """
+    if terms.get('fee_fixed') is None and terms.get('fee_percent') is None:
+        return None
+    fee = float(terms.get('fee_fixed') or 0) + float(amount) * float(terms.get('fee_percent') or 0) / 100
+    return round(max(fee, float(terms.get('fee_minimum') or 0)), 7)
+
+
+def fees(sep, operation, asset_code, amounts, type=None):
+    """
+    Returns the fee of each of amounts, in the same order.
+
+    Fixed and percent fees are computed in one pass over amounts. Dynamic
+    fees are asked to /fee, once per distinct amount and
+    settings.BATCH_CONCURRENCY requests at a time.
+    """
+    asset = terms(sep, operation, asset_code)
+    if asset['fee_fixed'] is not None or asset['fee_percent'] is not None:
+        fixed = float(asset['fee_fixed'] or 0)
+        rate = float(asset['fee_percent'] or 0) / 100
+        minimum = float(asset['fee_minimum'] or 0)
+        return [round(max(fixed + float(amount) * rate, minimum), 7) for amount in amounts]
+
+    if not index(sep)['fee_endpoint']:
+        raise ValueError(f'The anchor publishes no fee for {operation} of {asset_code}')
+    module = importlib.import_module(sep)
+    params = {'operation': operation, 'asset_code': asset_code}
+    if type is not None:
+        params['type'] = type
+
+    def fetch(amount):
+        return float(module.fee(dict(params, amount=amount))['fee'])
+
+    amounts = list(amounts)
+    distinct = list(dict.fromkeys(amounts))
+    with ThreadPoolExecutor(min(settings.BATCH_CONCURRENCY, len(distinct) or 1)) as executor:
+        by_amount = dict(zip(distinct, executor.map(fetch, distinct)))
+    return [by_amount[amount] for amount in amounts]
+
+
+def fee(sep, operation, asset_code, amount, type=None):
+    """
+    Returns the fee of amount as the /fee endpoint would, {"fee": fee}.
+    """
+    return {'fee': fees(sep, operation, asset_code, [amount], type)[0]}
+
+
+def _check_fields(fields, params, problems, prefix=''):
+    for name, spec in fields.items():
+        value = params.get(name)
+        if value in [None, '']:
+            if not spec['optional']:
+                problems.append(f'{prefix}{name} is required')
+        elif spec['choices'] and value not in spec['choices']:
+            problems.append(f'{prefix}{name} must be one of {", ".join(map(str, spec["choices"]))}')
+
+
+def validate(sep, operation, params):
+    """
+    Raises ValueError listing what is wrong in the params of a deposit,
+    withdraw or ("sep31", "receive") transaction: asset not enabled, amount
+    out of bounds, missing fields or values not among the choices.
+    """
+    asset = terms(sep, operation, params.get('asset_code'))
+    problems = []
+
+    amount = params.get('amount')
+    if amount not in [None, '']:
+        try:
+            amount = float(amount)
+        except (TypeError, ValueError):
+            problems.append('amount must be a number')
+        else:
+            if asset['min_amount'] is not None and amount < float(asset['min_amount']):
+                problems.append(f'amount must be at least {asset["min_amount"]}')
+            if asset['max_amount'] is not None and amount > float(asset['max_amount']):
+                problems.append(f'amount must be at most {asset["max_amount"]}')
+
+    if sep == 'sep31':
+        for category, fields in asset['fields'].items():
+            _check_fields(fields, (params.get('fields') or {}).get(category) or {}, problems, f'{category}.')
+    elif sep == 'sep6':
+        if operation == 'withdraw' and asset['types']:
+            if params.get('type') not in asset['types']:
+                problems.append(f'type must be one of {", ".join(asset["types"])}')
+            else:
+                _check_fields(asset['types'][params['type']], params, problems)
+        _check_fields(asset['fields'], params, problems)
+    # SEP-24 fields are collected by the anchor's interactive flow
+
+    if problems:
+        raise ValueError('; '.join(problems))
+
+
+def check(sep, operation, params):
+    """
+    validate() for the SEP modules: anchors whose /info can't be loaded are
+    left to reject invalid requests themselves.
+    """
+    try:
+        index(sep)
+    except (OSError, ValueError, KeyError):
+        return
+    validate(sep, operation, params)
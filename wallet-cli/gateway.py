@@ -0,0 +1,220 @@
+"""
+Local HTTP gateway running the batch operations for other processes.
+
+`cli.py serve` unlocks the database once, then answers
+
+    POST /<option>/<operation>   ex: POST /sep24/transaction
+
+with the JSON body as the operation params, and returns {"result": ...}.
+The optional X-SEP10-Token header overrides the cached SEP-10 token, like
+"token" in batch input. GET /operations lists the operations and GET /health
+answers {"status": "ok"}.
+
+Requests are served by threads sharing the process wide HTTP session,
+stellar.toml and token caches, with at most settings.BATCH_CONCURRENCY
+operations running at a time. The gateway only listens on a loopback address
+or on a Unix socket only readable by its owner. Web pages can't call it
+either: requests with an Origin header, or whose Host isn't the gateway's
+address (DNS rebinding), are refused with a 403, and POST bodies must be
+sent as application/json, which browsers can't do without CORS preflight.
+
+Errors are answered with {"error": ...}: 400 for invalid params or
+requests, 404 for
+unknown operations, 502 when the anchor or Horizon could not be reached and
+500 for anything else.
+"""
+import ipaddress
+import json
+import os
+import socket
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, unquote
+import batch
+import settings
+
+# largest accepted request body
+MAX_BODY_SIZE = 1024 * 1024
+LOOPBACK_NAMES = ['localhost', '127.0.0.1', '[::1]']
+
+
+def is_loopback(host):
+    """
+    Returns whether host is a loopback address or localhost.
+    """
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _refused(self):
+        """
+        Answers 403 and returns True if the request may come from a web page.
+        """
+        if 'Origin' in self.headers:
+            error = 'cross-origin requests are not allowed'
+        elif self.server.hosts is not None and self.headers.get('Host') not in self.server.hosts:
+            error = 'Host must be the gateway address'
+        else:
+            return False
+        # the body, if any, is not read
+        self.close_connection = True
+        self._send(403, {'error': error})
+        return True
+
+    def do_GET(self):
+        if self._refused():
+            return
+        path = urlsplit(self.path).path.rstrip('/')
+        if path == '/health':
+            return self._send(200, {'status': 'ok'})
+        if path == '/operations':
+            return self._send(200, {'operations': sorted(batch.OPERATIONS)})
+        self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self._refused():
+            return
+        op = ' '.join(unquote(part) for part in urlsplit(self.path).path.strip('/').split('/'))
+        length = self.headers.get('Content-Length', '0')
+        if not (length.isascii() and length.isdigit()):
+            self.close_connection = True
+            return self._send(400, {'error': 'invalid Content-Length'})
+        if int(length) > MAX_BODY_SIZE:
+            self.close_connection = True
+            return self._send(413, {'error': 'request body too large'})
+        body = self.rfile.read(int(length))
+        if op not in batch.OPERATIONS:
+            return self._send(404, {'error': f'Unknown operation "{op}"'})
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type != 'application/json':
+            return self._send(415, {'error': 'Content-Type must be application/json'})
+        try:
+            params = json.loads(body or b'{}')
+        except ValueError:
+            return self._send(400, {'error': 'body must be a JSON object'})
+        if not isinstance(params, dict):
+            return self._send(400, {'error': 'body must be a JSON object'})
+
+        status, content = self.server.run(op, params, self.headers.get('X-SEP10-Token'))
+        self._send(status, content)
+
+    def _send(self, status, content):
+        body = json.dumps(content, default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class UnixHandler(Handler):
+    # not a TCP socket
+    disable_nagle_algorithm = False
+
+
+def _error(exception):
+    return {'error': f'{type(exception).__name__}: {exception}'}
+
+
+class _Gateway:
+    daemon_threads = True
+    verbose = False
+    # accepted Host headers, None for any
+    hosts = None
+
+    def setup_gateway(self, concurrency, verbose):
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.verbose = verbose
+
+    def run(self, op, params, token):
+        """
+        Runs op and returns the HTTP status and content of its answer.
+        """
+        from requests.exceptions import RequestException
+        with self.slots:
+            try:
+                return 200, {'result': batch.run_operation(op, params, token)}
+            except (KeyError, TypeError, ValueError) as e:
+                return 400, _error(e)
+            except (RequestException, ConnectionError) as e:
+                return 502, _error(e)
+            except Exception as e:
+                return 500, _error(e)
+
+
+class TCPGateway(_Gateway, ThreadingHTTPServer):
+
+    def setup_gateway(self, concurrency, verbose):
+        super().setup_gateway(concurrency, verbose)
+        host, port = self.server_address[:2]
+        names = LOOPBACK_NAMES + [f'[{host}]' if ':' in host else host]
+        self.hosts = {f'{name}:{port}' for name in names}
+        if port == 80:
+            self.hosts.update(names)
+
+
+class TCP6Gateway(TCPGateway):
+    address_family = socket.AF_INET6
+
+
+class UnixGateway(_Gateway, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        old_umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(old_umask)
+
+
+def create(port=None, host='127.0.0.1', socket_path=None, concurrency=None, verbose=False):
+    """
+    Returns a gateway listening on socket_path if given, else on host:port.
+    Raises ValueError if host is not a loopback address.
+    """
+    if not socket_path and not is_loopback(host):
+        raise ValueError(f'{host} is not a loopback address, the gateway has no authentication')
+    if socket_path:
+        server = UnixGateway(socket_path, UnixHandler)
+    else:
+        server_class = TCP6Gateway if ':' in host else TCPGateway
+        server = server_class((host, port or 0), Handler)
+    server.setup_gateway(concurrency or settings.BATCH_CONCURRENCY, verbose)
+    return server
+
+
+def serve(port=None, host='127.0.0.1', socket_path=None, concurrency=None, verbose=False):
+    """
+    Serves the gateway until interrupted.
+    """
+    server = create(port, host, socket_path, concurrency, verbose)
+    host, port = ('', '') if socket_path else server.server_address[:2]
+    address = socket_path or 'http://{}:{}'.format(f'[{host}]' if ':' in host else host, port)
+    print(f'Serving {len(batch.OPERATIONS)} operations on {address}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
@@ -0,0 +1,177 @@
+"""
+Local SQLite index of SEP-6 and SEP-24 transactions.
+
+sync() walks every page of the anchor's /transactions endpoint for an asset
+and upserts the records in settings.HISTORY_PATH. It then stores a
+high-watermark, the start date of the oldest transaction which may still
+change (or of the newest one when all are final), so the next sync only asks
+the anchor for transactions no older than it.
+"""
+import json
+import sqlite3
+from contextlib import closing
+import settings
+from tokens import get_token
+
+TERMINAL_STATUSES = ['completed', 'refunded', 'expired', 'error', 'no_market',
+                     'too_small', 'too_large']
+COLUMNS = ['id', 'kind', 'status', 'started_at', 'completed_at',
+           'stellar_transaction_id', 'external_transaction_id']
+
+
+def _connect():
+    connection = sqlite3.connect(settings.HISTORY_PATH)
+    connection.row_factory = sqlite3.Row
+    with connection:
+        connection.executescript('''
+            CREATE TABLE IF NOT EXISTS transactions (
+                anchor_domain TEXT, account TEXT, sep TEXT, asset_code TEXT,
+                id TEXT, kind TEXT, status TEXT, started_at TEXT, completed_at TEXT,
+                stellar_transaction_id TEXT, external_transaction_id TEXT, data TEXT,
+                PRIMARY KEY (anchor_domain, account, sep, id)
+            );
+            CREATE INDEX IF NOT EXISTS transactions_status ON transactions (status);
+            CREATE INDEX IF NOT EXISTS transactions_kind ON transactions (kind);
+            CREATE INDEX IF NOT EXISTS transactions_asset_code ON transactions (asset_code);
+            CREATE INDEX IF NOT EXISTS transactions_started_at ON transactions (started_at);
+            CREATE INDEX IF NOT EXISTS transactions_stellar_transaction_id
+                ON transactions (stellar_transaction_id);
+            CREATE TABLE IF NOT EXISTS watermarks (
+                anchor_domain TEXT, account TEXT, sep TEXT, asset_code TEXT, started_at TEXT,
+                PRIMARY KEY (anchor_domain, account, sep, asset_code)
+            );
+            CREATE TABLE IF NOT EXISTS cursors (
+                stream TEXT PRIMARY KEY, cursor TEXT
+            );
+        ''')
+    return connection
+
+
+def _module(sep):
+    if sep == 'sep6':
+        import sep6
+        return sep6
+    if sep == 'sep24':
+        import sep24
+        return sep24
+    raise ValueError(f'Unsupported SEP "{sep}"')
+
+
+def _watermark(connection, key):
+    row = connection.execute(
+        'SELECT MIN(started_at) FROM transactions WHERE anchor_domain = ? AND account = ? '
+        'AND sep = ? AND asset_code = ? AND status NOT IN ({})'.format(
+            ', '.join('?' * len(TERMINAL_STATUSES))),
+        key + tuple(TERMINAL_STATUSES)).fetchone()
+    if row[0] is None:
+        row = connection.execute(
+            'SELECT MAX(started_at) FROM transactions WHERE anchor_domain = ? AND account = ? '
+            'AND sep = ? AND asset_code = ?', key).fetchone()
+    return row[0]
+
+
+def store(connection, key, records):
+    with connection:
+        connection.executemany(
+            'INSERT OR REPLACE INTO transactions VALUES ({})'.format(', '.join('?' * 12)),
+            [key + tuple(record.get(column) for column in COLUMNS) + (json.dumps(record),)
+             for record in records])
+
+
+def save(sep, asset_code, records):
+    """
+    Stores records of the current anchor and account, ex: after a lookup.
+    """
+    with closing(_connect()) as connection:
+        store(connection, (settings.ANCHOR_DOMAIN, settings.PUBKEY, sep, asset_code), records)
+
+
+def sync(sep, asset_code, token=None, full=False):
+    """
+    Fetches the new and changed transactions of asset_code and returns how
+    many records were received. full ignores the stored watermark.
+    """
+    module = _module(sep)
+    token = token or get_token()
+    key = (settings.ANCHOR_DOMAIN, settings.PUBKEY, sep, asset_code)
+    with closing(_connect()) as connection:
+        params = {'asset_code': asset_code, 'limit': settings.HISTORY_PAGE_SIZE}
+        row = connection.execute(
+            'SELECT started_at FROM watermarks WHERE anchor_domain = ? AND account = ? '
+            'AND sep = ? AND asset_code = ?', key).fetchone()
+        if row is not None and row[0] is not None and not full:
+            params['no_older_than'] = row[0]
+
+        count = 0
+        while True:
+            page = module.transactions(params, token).get('transactions') or []
+            if not page or page[-1]['id'] == params.get('paging_id'):
+                break
+            store(connection, key, page)
+            count += len(page)
+            params['paging_id'] = page[-1]['id']
+
+        with connection:
+            connection.execute('INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?, ?, ?)',
+                               key + (_watermark(connection, key),))
+        return count
+
+
+def query(sep=None, status=None, kind=None, asset_code=None, since=None, until=None,
+          stellar_transaction_id=None, limit=None):
+    """
+    Returns the indexed transactions of the current anchor and account
+    matching every given filter, newest first.
+    """
+    where = ['anchor_domain = ?', 'account = ?']
+    values = [settings.ANCHOR_DOMAIN, settings.PUBKEY]
+    for column, value in [('sep', sep), ('status', status), ('kind', kind),
+                          ('asset_code', asset_code),
+                          ('stellar_transaction_id', stellar_transaction_id)]:
+        if value is not None:
+            where.append(f'{column} = ?')
+            values.append(value)
+    if since is not None:
+        where.append('started_at >= ?')
+        values.append(since)
+    if until is not None:
+        where.append('started_at < ?')
+        values.append(until)
+    sql = 'SELECT data FROM transactions WHERE {} ORDER BY started_at DESC'.format(' AND '.join(where))
+    if limit is not None:
+        sql += ' LIMIT ?'
+        values.append(int(limit))
+    with closing(_connect()) as connection:
+        return [json.loads(row['data']) for row in connection.execute(sql, values)]
+
+
+def pending(kind=None):
+    """
+    Returns (sep, asset_code, record) for each indexed transaction of the
+    current anchor and account which isn't final and has no Stellar
+    transaction yet, optionally of one kind.
+    """
+    sql = ('SELECT sep, asset_code, data FROM transactions WHERE anchor_domain = ? AND account = ? '
+           'AND stellar_transaction_id IS NULL AND status NOT IN ({})'.format(
+               ', '.join('?' * len(TERMINAL_STATUSES))))
+    values = [settings.ANCHOR_DOMAIN, settings.PUBKEY] + TERMINAL_STATUSES
+    if kind is not None:
+        sql += ' AND kind = ?'
+        values.append(kind)
+    with closing(_connect()) as connection:
+        return [(row['sep'], row['asset_code'], json.loads(row['data']))
+                for row in connection.execute(sql, values)]
+
+
+def cursor(stream):
+    """
+    Returns the saved position in an event stream, or None.
+    """
+    with closing(_connect()) as connection:
+        row = connection.execute('SELECT cursor FROM cursors WHERE stream = ?', (stream,)).fetchone()
+    return row['cursor'] if row is not None else None
+
+
+def save_cursor(stream, position):
+    with closing(_connect()) as connection, connection:
+        connection.execute('INSERT OR REPLACE INTO cursors VALUES (?, ?)', (stream, position))
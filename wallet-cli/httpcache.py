@@ -0,0 +1,221 @@
+"""
+On-disk cache of anchor GET responses, shared by every CLI process.
+
+Responses of requests made with cached=True (the /info and /fee endpoints)
+are stored in an SQLite database in settings.CACHE_DIR, keyed by the URL and
+its sorted query parameters. A response is reused for its Cache-Control
+max-age, else until its Expires date, else for settings.HTTP_CACHE_TTL
+seconds; no-store responses aren't stored and no-cache ones are always
+revalidated. Stale responses with an ETag are revalidated with
+If-None-Match. When the stored bodies exceed settings.HTTP_CACHE_MAX_SIZE
+bytes, the least recently used responses are evicted.
+
+Lookups of fresh responses are read-only: hits and misses are counted in
+memory and added to the database every COUNTS_FLUSH_INTERVAL seconds and at
+exit, and the access time used for eviction is only updated when it is
+older than ACCESS_RESOLUTION seconds.
+"""
+import atexit
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from urllib.parse import urlencode
+import cache
+import settings
+
+DATABASE_NAME = 'http.sqlite'
+# share of HTTP_CACHE_MAX_SIZE kept after an eviction, so that it doesn't
+# run on every store
+EVICTION_TARGET = 0.9
+COUNTS_FLUSH_INTERVAL = 5
+ACCESS_RESOLUTION = 60
+
+_schemas = set()
+_schemas_lock = threading.Lock()
+_counts = collections.Counter()
+_counts_flushed_at = time.monotonic()
+_counts_lock = threading.Lock()
+
+
+def _path():
+    return os.path.join(settings.CACHE_DIR, DATABASE_NAME)
+
+
+def _connect():
+    path = _path()
+    if path not in _schemas:
+        # threads opening their first connection at the same time would
+        # switch to WAL concurrently, and fail with "database is locked"
+        with _schemas_lock:
+            if path not in _schemas:
+                os.makedirs(settings.CACHE_DIR, exist_ok=True)
+                with _open(path) as connection:
+                    connection.executescript('''
+                        PRAGMA journal_mode = WAL;
+                        CREATE TABLE IF NOT EXISTS responses (
+                            key TEXT PRIMARY KEY, status INTEGER, headers TEXT, body BLOB,
+                            etag TEXT, expires REAL, size INTEGER, accessed REAL
+                        );
+                        CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+                        CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER);
+                    ''')
+                connection.close()
+                _schemas.add(path)
+    return _open(path)
+
+
+def _open(path):
+    connection = sqlite3.connect(path, timeout=10)
+    # losing the last writes on power loss only costs cache misses
+    connection.execute('PRAGMA synchronous = NORMAL')
+    return connection
+
+
+def key(url, params=None):
+    """
+    Returns the cache key of a GET of url with params, whatever their order.
+    """
+    if isinstance(params, dict):
+        params = params.items()
+    params = sorted((str(name), str(value)) for name, value in (params or []) if value is not None)
+    return url + ('?' + urlencode(params) if params else '')
+
+
+def _count(connection, name, value=1):
+    connection.execute('INSERT INTO counters VALUES (?, ?) '
+                       'ON CONFLICT (name) DO UPDATE SET value = value + ?', (name, value, value))
+
+
+def _flush_counts(connection):
+    """
+    Adds the hits and misses counted in memory to the database.
+    """
+    global _counts_flushed_at
+    with _counts_lock:
+        counts = dict(_counts)
+        _counts.clear()
+        _counts_flushed_at = time.monotonic()
+    for name, value in counts.items():
+        _count(connection, name, value)
+
+
+@atexit.register
+def flush():
+    """
+    Adds the counts of this process to the database.
+    """
+    if not _counts:
+        return
+    try:
+        with closing(_connect()) as connection, connection:
+            _flush_counts(connection)
+    except (OSError, sqlite3.Error):
+        # only statistics are lost, ex: the cache directory was removed
+        pass
+
+
+def lookup(cache_key):
+    """
+    Returns the stored response of cache_key, {status, headers, body, etag,
+    expires}, or None. A fresh response counts as a hit, anything else as a
+    miss until revalidated().
+    """
+    now = time.time()
+    with closing(_connect()) as connection:
+        row = connection.execute('SELECT status, headers, body, etag, expires, accessed FROM responses '
+                                 'WHERE key = ?', (cache_key,)).fetchone()
+        fresh = row is not None and row[4] > now
+        with _counts_lock:
+            _counts['hits' if fresh else 'misses'] += 1
+        touch = fresh and row[5] < now - ACCESS_RESOLUTION
+        if touch or time.monotonic() - _counts_flushed_at > COUNTS_FLUSH_INTERVAL:
+            with connection:
+                if touch:
+                    connection.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, cache_key))
+                _flush_counts(connection)
+    if row is None:
+        return None
+    return {'status': row[0], 'headers': json.loads(row[1]), 'body': row[2], 'etag': row[3], 'expires': row[4]}
+
+
+def store(cache_key, status, headers, body):
+    """
+    Stores a response unless its headers forbid it, then evicts the least
+    recently used responses over settings.HTTP_CACHE_MAX_SIZE.
+    """
+    max_age = cache.max_age(headers, settings.HTTP_CACHE_TTL)
+    if max_age is None or len(body) > settings.HTTP_CACHE_MAX_SIZE:
+        return
+    now = time.time()
+    with closing(_connect()) as connection, connection:
+        connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (
+            cache_key, status, json.dumps(dict(headers)), body, headers.get('ETag'),
+            now + max_age, len(body), now,
+        ))
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= settings.HTTP_CACHE_MAX_SIZE:
+            return
+        evicted = 0
+        for row_key, size in connection.execute('SELECT key, size FROM responses ORDER BY accessed').fetchall():
+            if total <= settings.HTTP_CACHE_MAX_SIZE * EVICTION_TARGET:
+                break
+            connection.execute('DELETE FROM responses WHERE key = ?', (row_key,))
+            total -= size
+            evicted += 1
+        connection.execute('INSERT INTO counters VALUES (?, ?) '
+                           'ON CONFLICT (name) DO UPDATE SET value = value + ?',
+                           ('evictions', evicted, evicted))
+
+
+def revalidated(cache_key, headers):
+    """
+    Extends the freshness of cache_key after a 304 with headers.
+    """
+    max_age = cache.max_age(headers, settings.HTTP_CACHE_TTL)
+    with closing(_connect()) as connection, connection:
+        _count(connection, 'revalidations')
+        if max_age is None:
+            connection.execute('DELETE FROM responses WHERE key = ?', (cache_key,))
+        else:
+            connection.execute('UPDATE responses SET expires = ?, accessed = ? WHERE key = ?',
+                               (time.time() + max_age, time.time(), cache_key))
+
+
+def stats():
+    """
+    Returns the number and size of stored responses and the hit, miss,
+    revalidation and eviction counts since the last clear().
+    """
+    flush()
+    with closing(_connect()) as connection:
+        entries, size = connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        fresh = connection.execute('SELECT COUNT(*) FROM responses WHERE expires > ?',
+                                   (time.time(),)).fetchone()[0]
+        counters = dict(connection.execute('SELECT name, value FROM counters'))
+    hits, misses = counters.get('hits', 0), counters.get('misses', 0)
+    return {
+        'path': _path(),
+        'entries': entries,
+        'fresh_entries': fresh,
+        'size': size,
+        'max_size': settings.HTTP_CACHE_MAX_SIZE,
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else None,
+        'revalidations': counters.get('revalidations', 0),
+        'evictions': counters.get('evictions', 0),
+    }
+
+
+def clear():
+    with _counts_lock:
+        _counts.clear()
+    with closing(_connect()) as connection, connection:
+        connection.execute('DELETE FROM responses')
+        connection.execute('DELETE FROM counters')
+    with closing(_connect()) as connection:
+        connection.execute('VACUUM')
@@ -0,0 +1,532 @@
+"""
+Local stand-in for an anchor and Horizon, used by benchmark.py and for
+manual testing without network access.
+
+It serves stellar.toml, the SEP-10 challenge and token endpoints, the SEP-6,
+SEP-12, SEP-24 and SEP-31 routes called by the SEP modules, and the Horizon
+/accounts and /transactions endpoints and the /accounts/<id>/payments
+event stream. Each request can be delayed, a fraction of
+them delayed further to give a latency tail, and fail with a 503 at a given
+rate. Transactions advance from
+pending_user_transfer_start to pending_anchor to completed, one step every
+--step seconds, and completed deposits are paid to their account on the
+payments stream.
+
+    python mockanchor.py --port 8000 --latency 20
+
+The CLI is pointed at it with:
+
+    export WALLET_CLI_STELLAR_TOML_SCHEME=http
+    export WALLET_CLI_HORIZON_URL=http://localhost:8000/horizon
+
+and localhost:8000 as anchor domain.
+"""
+import argparse
+import base64
+import collections
+import hashlib
+import hmac
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+from stellar_sdk.keypair import Keypair
+from stellar_sdk.network import Network
+from stellar_sdk.sep.stellar_web_authentication import build_challenge_transaction
+from stellar_sdk.transaction_envelope import TransactionEnvelope
+
+ASSET_CODE = 'USDC'
+STATUSES = ['pending_user_transfer_start', 'pending_anchor', 'completed']
+INITIAL_SEQUENCE = 1000
+# seconds before Horizon closes an event stream, clients reconnect with their cursor
+STREAM_TIMEOUT = 60
+ASSET_INFO = {
+    'enabled': True,
+    'fee_fixed': 1,
+    'fee_percent': 0.5,
+    'min_amount': 1,
+    'max_amount': 100000,
+}
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+class MockAnchor(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0, error_rate=0, step=5,
+                 slow_rate=0, slow_latency=0, network_passphrase=Network.TESTNET_NETWORK_PASSPHRASE):
+        super().__init__(address, Handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.step = step
+        self.network_passphrase = network_passphrase
+        self.signing_key = Keypair.random()
+        self.issuer = Keypair.random().public_key
+        self.distribution = Keypair.random().public_key
+        self.transactions = {}
+        self.sequences = {}
+        self.requests = collections.Counter()
+        self.lock = threading.Lock()
+        self.payments = []
+        self.payments_added = threading.Condition(self.lock)
+        self.stream_timeout = STREAM_TIMEOUT
+
+    @property
+    def domain(self):
+        return '{}:{}'.format(*self.server_address[:2])
+
+    @property
+    def url(self):
+        return 'http://' + self.domain
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def serve_forever(self, poll_interval=0.5):
+        threading.Thread(target=self._pay_deposits, daemon=True).start()
+        super().serve_forever(poll_interval)
+
+    def _pay_deposits(self):
+        while True:
+            with self.lock:
+                transactions = [t for t in self.transactions.values()
+                                if t['kind'] == 'deposit' and t.get('to') and 'stellar_transaction_id' not in t]
+            for transaction in transactions:
+                if self.public(transaction)['status'] == 'completed':
+                    payment = self.add_payment(transaction['to'], transaction['asset_code'],
+                                               transaction['amount_in'], transaction.get('deposit_memo'),
+                                               transaction.get('deposit_memo_type', 'text'))
+                    transaction['stellar_transaction_id'] = payment['transaction_hash']
+                    transaction['completed_at'] = payment['created_at']
+            time.sleep(0.05)
+
+    def add_payment(self, to, asset_code, amount, memo=None, memo_type='text'):
+        """
+        Adds a payment from the distribution account to the payments stream.
+        """
+        with self.lock:
+            paging_token = str(len(self.payments) + 1)
+            payment = {
+                'id': paging_token,
+                'paging_token': paging_token,
+                'type': 'payment',
+                'created_at': _now(),
+                'transaction_hash': hashlib.sha256(uuid.uuid4().bytes).hexdigest(),
+                'from': self.distribution,
+                'to': to,
+                'asset_type': 'credit_alphanum4' if len(asset_code) <= 4 else 'credit_alphanum12',
+                'asset_code': asset_code,
+                'asset_issuer': self.issuer,
+                'amount': str(amount),
+                'memo': memo,
+                'memo_type': memo_type if memo is not None else 'none',
+            }
+            self.payments.append(payment)
+            self.payments_added.notify_all()
+        return payment
+
+    def request_count(self):
+        with self.lock:
+            return sum(self.requests.values())
+
+    def reset_counts(self):
+        with self.lock:
+            self.requests.clear()
+
+    def add_transaction(self, sep, kind, amount, **fields):
+        transaction = {
+            'id': str(uuid.uuid4()),
+            'kind': kind,
+            'amount_in': str(amount),
+            'amount_fee': str(ASSET_INFO['fee_fixed'] + float(amount) * ASSET_INFO['fee_percent'] / 100),
+            'started_at': _now(),
+            'created': time.time(),
+            'sep': sep,
+            'asset_code': fields.pop('asset_code', ASSET_CODE),
+        }
+        if kind == 'withdrawal' or sep == 'sep31':
+            prefix = {'sep6': '', 'sep24': 'withdraw_', 'sep31': 'stellar_'}[sep]
+            transaction[prefix + ('anchor_account' if sep == 'sep24' else 'account_id')] = self.distribution
+            transaction[prefix + 'memo_type'] = 'id'
+            transaction[prefix + 'memo'] = str(random.randrange(1, 2 ** 63))
+        transaction.update(fields)
+        with self.lock:
+            self.transactions[transaction['id']] = transaction
+        return transaction
+
+    def seed(self, sep, count):
+        """
+        Adds count past transactions, one minute apart, for history tests.
+        """
+        start = time.time() - count * 60
+        for i in range(count):
+            transaction = self.add_transaction(sep, random.choice(['deposit', 'withdrawal']), 10 + i)
+            transaction['created'] = start + i * 60 - 3 * self.step
+            transaction['started_at'] = datetime.fromtimestamp(
+                start + i * 60, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+    def public(self, transaction):
+        """
+        Returns transaction as the anchor would send it, with its current status.
+        """
+        record = {k: v for k, v in transaction.items() if k not in ['created', 'sep', 'asset_code']}
+        step = int((time.time() - transaction['created']) / self.step) if self.step else len(STATUSES)
+        record['status'] = STATUSES[min(step, len(STATUSES) - 1)]
+        return record
+
+    def token(self, account):
+        now = int(time.time())
+        header = _b64(json.dumps({'alg': 'HS256', 'typ': 'JWT'}).encode())
+        payload = _b64(json.dumps({
+            'iss': self.url + '/auth',
+            'sub': account,
+            'iat': now,
+            'exp': now + 86400,
+        }).encode())
+        signature = hmac.new(self.signing_key.secret.encode(), f'{header}.{payload}'.encode(),
+                             hashlib.sha256).digest()
+        return f'{header}.{payload}.{_b64(signature)}'
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, don't wait for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def _handle(self, method):
+        url = urlparse(self.path)
+        self.params = dict(parse_qsl(url.query))
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            self.params.update(json.loads(body or b'{}'))
+        elif self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+            self.params.update(parse_qsl(body.decode()))
+        self.body = body
+
+        with self.server.lock:
+            self.server.requests[(method, url.path)] += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if random.random() < self.server.slow_rate:
+            time.sleep(self.server.slow_latency)
+        if random.random() < self.server.error_rate:
+            return self._send(503, {'error': 'injected error'})
+
+        for route_method, pattern, authenticated, name in ROUTES:
+            match = re.fullmatch(pattern, url.path)
+            if route_method == method and match:
+                if authenticated and not self.headers.get('Authorization', '').startswith('Bearer '):
+                    return self._send(403, {'type': 'authentication_required'})
+                try:
+                    result = getattr(self, name)(*match.groups())
+                    # streaming handlers answer by themselves
+                    return result and self._send(*result)
+                except Exception as e:
+                    return self._send(400, {'error': f'{e.__class__.__name__}: {e}'})
+        self._send(404, {'error': 'not found'})
+
+    def _send(self, status, content, content_type='application/json'):
+        body = content.encode() if isinstance(content, str) else json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stellar_toml(self):
+        url = self.server.url
+        content = '\n'.join([
+            f'NETWORK_PASSPHRASE="{self.server.network_passphrase}"',
+            f'SIGNING_KEY="{self.server.signing_key.public_key}"',
+            f'WEB_AUTH_ENDPOINT="{url}/auth"',
+            f'TRANSFER_SERVER="{url}/sep6"',
+            f'TRANSFER_SERVER_SEP0024="{url}/sep24"',
+            f'TRANSFER_SERVER_SEP0031="{url}/sep31"',
+            f'KYC_SERVER="{url}/sep12"',
+            '',
+            '[[CURRENCIES]]',
+            f'code="{ASSET_CODE}"',
+            f'issuer="{self.server.issuer}"',
+        ])
+        return 200, content + '\n', 'text/plain'
+
+    def challenge(self):
+        return 200, {
+            'transaction': build_challenge_transaction(
+                self.server.signing_key.secret, self.params['account'], 'mockanchor',
+                self.server.network_passphrase),
+            'network_passphrase': self.server.network_passphrase,
+        }
+
+    def token(self):
+        envelope = TransactionEnvelope.from_xdr(self.params['transaction'],
+                                                self.server.network_passphrase)
+        return 200, {'token': self.server.token(envelope.transaction.operations[0].source)}
+
+    def info(self, sep):
+        if sep == 'sep31':
+            return 200, {'receive': {ASSET_CODE: dict(ASSET_INFO, fields={'transaction': {
+                'receiver_routing_number': {'description': 'routing number of the destination bank account'},
+                'receiver_account_number': {'description': 'bank account number of the destination'},
+                'type': {'description': 'type of deposit', 'choices': ['SEPA', 'SWIFT']},
+            }})}}
+        withdraw = dict(ASSET_INFO, types={'bank_account': {'fields': {
+            'dest': {'description': 'IBAN'},
+            'dest_extra': {'description': 'BIC', 'optional': True},
+        }}})
+        return 200, {
+            'deposit': {ASSET_CODE: dict(ASSET_INFO)},
+            'withdraw': {ASSET_CODE: withdraw},
+            'fee': {'enabled': True},
+            'transaction': {'enabled': True, 'authentication_required': True},
+            'transactions': {'enabled': True, 'authentication_required': True},
+        }
+
+    def fee(self, sep):
+        amount = float(self.params['amount'])
+        return 200, {'fee': ASSET_INFO['fee_fixed'] + amount * ASSET_INFO['fee_percent'] / 100}
+
+    def _deposit_fields(self, kind):
+        fields = {'asset_code': self.params.get('asset_code')}
+        if kind == 'deposit' and self.params.get('account'):
+            fields['to'] = self.params['account']
+            if self.params.get('memo'):
+                fields['deposit_memo'] = self.params['memo']
+                fields['deposit_memo_type'] = self.params.get('memo_type', 'text')
+        return fields
+
+    def sep6_transfer(self, operation):
+        kind = 'deposit' if operation == 'deposit' else 'withdrawal'
+        transaction = self.server.add_transaction('sep6', kind, self.params.get('amount', 0),
+                                                  **self._deposit_fields(kind))
+        if kind == 'deposit':
+            return 200, {'how': 'Make a transfer to IBAN MOCK0000000000', 'id': transaction['id']}
+        return 200, {
+            'id': transaction['id'],
+            'account_id': transaction['account_id'],
+            'memo_type': transaction['memo_type'],
+            'memo': transaction['memo'],
+        }
+
+    def sep24_interactive(self, operation):
+        kind = 'deposit' if operation == 'deposit' else 'withdrawal'
+        transaction = self.server.add_transaction('sep24', kind, self.params.get('amount', 0),
+                                                  **self._deposit_fields(kind))
+        return 200, {
+            'type': 'interactive_customer_info_needed',
+            'url': f'{self.server.url}/sep24/interactive?id={transaction["id"]}',
+            'id': transaction['id'],
+        }
+
+    def transaction(self, sep):
+        transaction_id = self.params.get('id')
+        with self.server.lock:
+            transaction = self.server.transactions.get(transaction_id)
+        if transaction is None:
+            # lookups of unknown ids get a transaction, for status benchmarks
+            transaction = self.server.add_transaction(sep, 'deposit', 10, id=transaction_id or str(uuid.uuid4()))
+        return 200, {'transaction': self.server.public(transaction)}
+
+    def transactions(self, sep):
+        params = self.params
+        with self.server.lock:
+            records = [t for t in self.server.transactions.values()
+                       if t['sep'] == sep and t['asset_code'] == params.get('asset_code')]
+        records.sort(key=lambda t: t['started_at'], reverse=True)
+        if params.get('kind'):
+            records = [t for t in records if t['kind'] == params['kind']]
+        if params.get('no_older_than'):
+            records = [t for t in records if t['started_at'] >= params['no_older_than']]
+        if params.get('paging_id'):
+            ids = [t['id'] for t in records]
+            records = records[ids.index(params['paging_id']) + 1:] if params['paging_id'] in ids else []
+        records = records[:int(params.get('limit') or 200)]
+        return 200, {'transactions': [self.server.public(t) for t in records]}
+
+    def customer_get(self):
+        return 200, {'id': self.params.get('id') or str(uuid.uuid4()), 'status': 'ACCEPTED'}
+
+    def customer_put(self):
+        return 202, {'id': str(uuid.uuid4())}
+
+    def sep31_post(self):
+        amount = self.params.get('amount', 0)
+        transaction = self.server.add_transaction('sep31', 'send', amount,
+                                                  asset_code=self.params.get('asset_code'))
+        return 201, {
+            'id': transaction['id'],
+            'stellar_account_id': transaction['stellar_account_id'],
+            'stellar_memo_type': transaction['stellar_memo_type'],
+            'stellar_memo': transaction['stellar_memo'],
+        }
+
+    def sep31_get(self, transaction_id):
+        with self.server.lock:
+            transaction = self.server.transactions.get(transaction_id)
+        if transaction is None:
+            transaction = self.server.add_transaction('sep31', 'send', 10, id=transaction_id)
+        return 200, {'transaction': self.server.public(transaction)}
+
+    def sep31_patch(self, transaction_id):
+        with self.server.lock:
+            transaction = self.server.transactions.get(transaction_id)
+        if transaction is None:
+            return 404, {'error': 'transaction not found'}
+        transaction['fields'] = self.params.get('fields')
+        return 200, {'transaction': self.server.public(transaction)}
+
+    def horizon_account(self, account_id):
+        with self.server.lock:
+            sequence = self.server.sequences.setdefault(account_id, INITIAL_SEQUENCE)
+        return 200, {
+            'id': account_id,
+            'account_id': account_id,
+            'sequence': str(sequence),
+            'balances': [{'asset_type': 'native', 'balance': '10000.0000000'}],
+            'data': {},
+        }
+
+    def _write_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def horizon_payments(self, account_id):
+        """
+        Streams the payments of account_id as server-sent events, from the
+        cursor (Last-Event-ID header or cursor param, "now" by default), until
+        the stream times out. Without Accept: text/event-stream, returns a page
+        of them.
+        """
+        if 'text/event-stream' not in self.headers.get('Accept', ''):
+            with self.server.lock:
+                records = [p for p in self.server.payments if account_id in (p['from'], p['to'])]
+            if self.params.get('order') == 'desc':
+                records.reverse()
+            records = records[:int(self.params.get('limit') or 10)]
+            return 200, {'_embedded': {'records': records}}
+        cursor = self.headers.get('Last-Event-ID') or self.params.get('cursor') or 'now'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        deadline = time.time() + self.server.stream_timeout
+        try:
+            self._write_chunk('retry: 1000\nevent: open\ndata: "hello"\n\n')
+            with self.server.lock:
+                position = len(self.server.payments) if cursor == 'now' else int(cursor)
+            while time.time() < deadline:
+                with self.server.payments_added:
+                    self.server.payments_added.wait_for(lambda: len(self.server.payments) > position,
+                                                        deadline - time.time())
+                    payments = self.server.payments[position:]
+                position += len(payments)
+                for payment in payments:
+                    if account_id not in (payment['from'], payment['to']):
+                        continue
+                    record = {k: v for k, v in payment.items() if k not in ['memo', 'memo_type']}
+                    if self.params.get('join') == 'transactions':
+                        record['transaction'] = {'hash': payment['transaction_hash'],
+                                                 'memo': payment['memo'], 'memo_type': payment['memo_type']}
+                    self._write_chunk(f'id: {payment["paging_token"]}\ndata: {json.dumps(record)}\n\n')
+            self._write_chunk('event: close\ndata: "byebye"\n\n')
+            self.wfile.write(b'0\r\n\r\n')
+        except ConnectionError:
+            pass
+        self.close_connection = True
+
+    def horizon_submit(self):
+        envelope = TransactionEnvelope.from_xdr(self.params['tx'], self.server.network_passphrase)
+        transaction = envelope.transaction
+        source = transaction.source.public_key
+        with self.server.lock:
+            sequence = self.server.sequences.setdefault(source, INITIAL_SEQUENCE)
+            if transaction.sequence != sequence + 1:
+                return 400, {'extras': {'result_codes': {'transaction': 'tx_bad_seq'}}}
+            self.server.sequences[source] = transaction.sequence
+        return 200, {
+            'hash': envelope.hash_hex(),
+            'ledger': 1,
+            'successful': True,
+            'envelope_xdr': self.params['tx'],
+        }
+
+
+ROUTES = [
+    # method, path, authentication required, handler
+    ('GET', r'/\.well-known/stellar\.toml', False, 'stellar_toml'),
+    ('GET', r'/auth', False, 'challenge'),
+    ('POST', r'/auth', False, 'token'),
+    ('GET', r'/(sep6|sep24|sep31)/info', False, 'info'),
+    ('GET', r'/(sep6|sep24)/fee', False, 'fee'),
+    ('GET', r'/sep6/(deposit|withdraw)', True, 'sep6_transfer'),
+    ('POST', r'/sep24/transactions/(deposit|withdraw)/interactive', True, 'sep24_interactive'),
+    ('GET', r'/(sep6|sep24)/transaction', True, 'transaction'),
+    ('GET', r'/(sep6|sep24)/transactions', True, 'transactions'),
+    ('GET', r'/sep12/customer', True, 'customer_get'),
+    ('PUT', r'/sep12/customer', True, 'customer_put'),
+    ('POST', r'/sep31/transactions', True, 'sep31_post'),
+    ('GET', r'/sep31/transactions/([^/]+)', True, 'sep31_get'),
+    ('PATCH', r'/sep31/transactions/([^/]+)', True, 'sep31_patch'),
+    ('GET', r'/horizon/accounts/([^/]+)', False, 'horizon_account'),
+    ('GET', r'/horizon/accounts/([^/]+)/payments', False, 'horizon_payments'),
+    ('POST', r'/horizon/transactions', False, 'horizon_submit'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock anchor and Horizon server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0, help='milliseconds added to each response')
+    parser.add_argument('--slow-rate', type=float, default=0, help='fraction of responses also delayed by --slow-latency')
+    parser.add_argument('--slow-latency', type=float, default=0, help='milliseconds')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of requests failing with 503')
+    parser.add_argument('--step', type=float, default=5, help='seconds between transaction status changes')
+    parser.add_argument('--seed', type=int, default=0, help='past SEP-24 transactions to create')
+    args = parser.parse_args()
+
+    server = MockAnchor((args.host, args.port), args.latency / 1000, args.error_rate, args.step,
+                        args.slow_rate, args.slow_latency / 1000)
+    server.seed('sep24', args.seed)
+    print(f'Anchor domain: {server.domain}')
+    print(f'Horizon URL: {server.url}/horizon')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Payment pipeline sending many payments from the wallet account.
+
+Items are dicts with destination, amount, asset_code ("XLM" for lumens),
+asset_issuer, and optional id, memo and memo_type keys. Items without memo
+are packed up to channels.MAX_OPERATIONS per transaction; items with a memo,
+such as payments to an anchor after a withdraw, are sent one per
+transaction. Transactions are submitted from the channel accounts in
+parallel, and each item gets its own result. Items of a transaction whose
+outcome is unknown (ex: submission timeout) get the "unknown" status and
+the transaction hash: they must be looked up on Horizon before being sent
+again, or they may be paid twice.
+"""
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from stellar_sdk.exceptions import BadRequestError
+import channels
+import settings
+
+
+# fields of the account to pay and its memo, in a SEP-6 withdraw response,
+# a SEP-24 transaction and a SEP-31 transaction
+ANCHOR_ACCOUNT_FIELDS = [
+    ('account_id', 'memo', 'memo_type'),
+    ('withdraw_anchor_account', 'withdraw_memo', 'withdraw_memo_type'),
+    ('stellar_account_id', 'stellar_memo', 'stellar_memo_type'),
+]
+
+
+def anchor_item(transaction, amount, asset_code, asset_issuer=None):
+    """
+    Returns the item paying the anchor for a withdraw or SEP-31 transaction.
+    """
+    for account_field, memo_field, memo_type_field in ANCHOR_ACCOUNT_FIELDS:
+        if transaction.get(account_field):
+            return {
+                'id': transaction.get('id'),
+                'destination': transaction[account_field],
+                'amount': amount,
+                'asset_code': asset_code,
+                'asset_issuer': asset_issuer,
+                'memo': transaction.get(memo_field),
+                'memo_type': transaction.get(memo_type_field),
+            }
+    raise ValueError('The transaction has no Stellar account to pay')
+
+
+def _add_memo(builder, memo, memo_type):
+    if memo_type in [None, 'text']:
+        builder.add_text_memo(memo)
+    elif memo_type == 'id':
+        builder.add_id_memo(int(memo))
+    elif memo_type == 'hash':
+        builder.add_hash_memo(base64.b64decode(memo))
+    elif memo_type == 'return':
+        builder.add_return_hash_memo(base64.b64decode(memo))
+    else:
+        raise ValueError(f'Unsupported memo type "{memo_type}"')
+
+
+def group(items):
+    """
+    Splits the indexes of items in lists sent as one transaction each.
+    """
+    groups = []
+    batch = []
+    for i, item in enumerate(items):
+        if item.get('memo') is not None:
+            groups.append([i])
+            continue
+        batch.append(i)
+        if len(batch) == channels.MAX_OPERATIONS:
+            groups.append(batch)
+            batch = []
+    if batch:
+        groups.append(batch)
+    return groups
+
+
+def _send(items):
+    def append_ops(builder):
+        for item in items:
+            asset_code = item.get('asset_code') or 'XLM'
+            builder.append_payment_op(
+                item['destination'], item['amount'], asset_code,
+                None if asset_code == 'XLM' else item['asset_issuer'],
+                source=settings.PUBKEY,
+            )
+        if items[0].get('memo') is not None:
+            _add_memo(builder, items[0]['memo'], items[0].get('memo_type'))
+
+    try:
+        response = channels.submit(append_ops)
+    except BadRequestError as e:
+        codes = ((e.extras or {}).get('result_codes') or {})
+        operations = codes.get('operations') or []
+        results = []
+        for i, item in enumerate(items):
+            if i >= len(operations):
+                error = codes.get('transaction') or str(e)
+            elif operations[i] == 'op_success':
+                # another operation failed the transaction
+                error = 'not submitted, transaction failed'
+            else:
+                error = operations[i]
+            results.append({'id': item.get('id'), 'status': 'error', 'error': error})
+        return results
+    except channels.UnknownOutcomeError as e:
+        return [{'id': item.get('id'), 'status': 'unknown', 'hash': e.hash, 'error': str(e)}
+                for item in items]
+    except Exception as e:
+        # failed before the transaction was sent
+        return [{'id': item.get('id'), 'status': 'error', 'error': f'{type(e).__name__}: {e}'}
+                for item in items]
+    return [{
+        'id': item.get('id'),
+        'status': 'ok',
+        'hash': response.get('hash'),
+        'operation_index': i,
+    } for i, item in enumerate(items)]
+
+
+def send(items):
+    """
+    Sends the payments of items and returns one result per item, in the same
+    order, with its status ("ok", "error" or "unknown") and transaction
+    hash or error.
+    """
+    items = list(items)
+    groups = group(items)
+    results = [None] * len(items)
+    with ThreadPoolExecutor(channels.size()) as executor:
+        # groups moved memo items ahead of batched ones, restore the input order
+        for indexes, group_results in zip(groups, executor.map(
+                lambda indexes: _send([items[i] for i in indexes]), groups)):
+            for i, result in zip(indexes, group_results):
+                results[i] = result
+    return results
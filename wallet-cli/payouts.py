@@ -0,0 +1,294 @@
+"""
+Bulk SEP-31 payouts from a CSV or JSONL file, resumable after a crash.
+
+Each row is a transaction to create: id (the row's idempotency key,
+required), amount, asset_code, optional sender_id and receiver_id, and its
+fields. In CSV, fields are columns named
+category.field, ex: transaction.receiver_account_number. In JSONL, they are
+a "fields" object.
+
+Rows are checked against the cached SEP-31 /info before anything is sent,
+then posted with bounded concurrency and at most settings.PAYOUT_RATE
+requests per second (pausing when the anchor answers 429). Every step is
+appended to a write-ahead journal, synced to disk before the request is
+sent:
+
+    pending   the request is about to be sent
+    created   the anchor created the transaction
+    rejected  the transaction was not created (invalid row, 4xx answer, anchor
+              unreachable), the row is tried again on the next run
+    unknown   the request was sent but its outcome is unknown (timeout, 5xx)
+
+Running the same file with the same journal again skips created rows, and
+never resends rows left pending or unknown, which may have been created:
+they are reported for manual reconciliation, see `sep31 get_transaction`.
+Journal entries hold a digest of the row's payload, and a row whose payload
+differs from the one journaled as sent is refused rather than resent or
+skipped, since its id may now name another payout.
+"""
+import csv
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import fees
+import resilience
+import settings
+import transport
+from sep1 import fetch_stellar_toml
+import tokens
+from utils import urljoin
+
+PAYLOAD_KEYS = ['amount', 'asset_code', 'sender_id', 'receiver_id', 'lang']
+# states after which a row must not be sent again
+FINAL_STATES = {'pending', 'created', 'unknown'}
+
+
+def read_rows(file, format='csv'):
+    """
+    Yields the rows of file (an open text file) as {"id", "amount",
+    "asset_code", ..., "fields": {category: {field: value}}}. Rows without
+    id get none: line numbers change when the file is edited, so they can't
+    identify rows across runs.
+    """
+    if format == 'csv':
+        for record in csv.DictReader(file):
+            row = {'fields': {}}
+            for column, value in record.items():
+                if column is None or value in [None, '']:
+                    continue
+                category, _, name = column.strip().partition('.')
+                if name:
+                    row['fields'].setdefault(category, {})[name] = value
+                else:
+                    row[category] = value
+            yield row
+    else:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+class Journal:
+    """
+    Append-only JSONL log of row states, with the last state of each row.
+    It is locked while open, so two runs can't use the same journal.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.states = {}
+        self._file = open(path, 'a')
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.close()
+            raise OSError(f'{path} is used by another run') from None
+        needs_newline = False
+        if os.path.isfile(path):
+            with open(path, 'rb') as file:
+                content = file.read()
+            needs_newline = bool(content) and not content.endswith(b'\n')
+            for line in content.splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # torn last line of a crashed run
+                    continue
+                self.states[entry['id']] = entry
+        if needs_newline:
+            self._file.write('\n')
+        self._lock = threading.Lock()
+
+    def last(self, row_id):
+        return self.states.get(row_id)
+
+    def record(self, row_id, state, **data):
+        """
+        Appends the new state of row_id and waits until it is on disk.
+        """
+        entry = dict(id=row_id, state=state, time=time.time(), **data)
+        with self._lock:
+            self._file.write(json.dumps(entry, default=str) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.states[row_id] = entry
+        return entry
+
+    def close(self):
+        self._file.close()
+
+
+class _RateLimiter:
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next - now
+            self.next = max(now, self.next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.next = max(self.next, time.monotonic() + seconds)
+
+
+class _Token:
+    """
+    The SEP-10 token shared by the payout threads, refreshed once for all of
+    them when the anchor refuses it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = tokens.get_token()
+
+    def refresh(self, rejected):
+        with self.lock:
+            if self.value == rejected:
+                self.value = tokens.get_token(rejected=rejected)
+
+
+def _error(response):
+    try:
+        return response.json().get('error') or response.text
+    except ValueError:
+        return response.text
+
+
+def _send(url, token, payload, limiter):
+    """
+    Posts payload and returns the state and journal data of the outcome. A
+    401 or 403 answer, with which nothing was created, is retried once with a
+    refreshed token.
+    """
+    import requests
+    attempt = 0
+    refreshed = False
+    while True:
+        limiter.wait()
+        sent_token = token.value
+        try:
+            response = transport.post(url, json=payload, headers={'Authorization': 'Bearer ' + sent_token})
+        except (resilience.CircuitOpenError, requests.ConnectTimeout) as e:
+            # never reached the anchor
+            return 'rejected', {'error': f'{type(e).__name__}: {e}'}
+        except requests.RequestException as e:
+            return 'unknown', {'error': f'{type(e).__name__}: {e}'}
+        if response.status_code in (401, 403) and not refreshed:
+            refreshed = True
+            token.refresh(sent_token)
+            continue
+        if response.status_code == 429 and attempt < settings.HTTP_IDEMPOTENT_RETRIES:
+            limiter.pause(resilience.backoff(attempt, response.headers.get('Retry-After')))
+            attempt += 1
+            continue
+        if response.status_code < 300:
+            return 'created', {'transaction': response.json()}
+        if response.status_code < 500:
+            return 'rejected', {'error': f'{response.status_code}: {_error(response)}'}
+        return 'unknown', {'error': f'{response.status_code}: {_error(response)}'}
+
+
+def _payload(row):
+    payload = {key: row[key] for key in PAYLOAD_KEYS if row.get(key) not in [None, '']}
+    if row.get('fields'):
+        payload['fields'] = row['fields']
+    return payload
+
+
+def digest(payload):
+    """
+    Returns the SHA-256 of payload in canonical JSON.
+    """
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def _payout(row_id, payload, url, token, journal, limiter):
+    payload_digest = digest(payload)
+    try:
+        fees.validate('sep31', 'receive', payload)
+    except ValueError as e:
+        return journal.record(row_id, 'rejected', digest=payload_digest, error=str(e))
+    journal.record(row_id, 'pending', digest=payload_digest)
+    try:
+        state, data = _send(url, token, payload, limiter)
+    except Exception as e:
+        state, data = 'unknown', {'error': f'{type(e).__name__}: {e}'}
+    return journal.record(row_id, state, digest=payload_digest, **data)
+
+
+def _result(entry, skipped=False):
+    result = {'id': entry['id'], 'state': entry['state']}
+    if skipped:
+        result['skipped'] = True
+    if 'transaction' in entry:
+        result['transaction_id'] = entry['transaction'].get('id')
+    if 'error' in entry:
+        result['error'] = entry['error']
+    return result
+
+
+def run(rows, journal_path, out, concurrency=None, rate=None):
+    """
+    Creates the transaction of each of rows not created by a previous run
+    with the same journal, writing one JSON result line per row to out, in
+    completion order. Returns the number of rows in each state.
+    """
+    concurrency = concurrency or settings.BATCH_CONCURRENCY
+    fees.index('sep31')
+    url = urljoin(fetch_stellar_toml()['TRANSFER_SERVER_SEP0031'], 'transactions')
+    token = _Token()
+    journal = Journal(journal_path)
+    limiter = _RateLimiter(settings.PAYOUT_RATE if rate is None else rate)
+    counts = {}
+    seen = set()
+
+    def write(result):
+        counts[result['state']] = counts.get(result['state'], 0) + 1
+        out.write(json.dumps(result) + '\n')
+        out.flush()
+
+    try:
+        with ThreadPoolExecutor(concurrency) as executor:
+            pending = set()
+            for row in rows:
+                if not isinstance(row, dict) or row.get('id') in [None, '']:
+                    write({'id': None, 'state': 'rejected', 'error': 'missing id'})
+                    continue
+                row_id = str(row['id'])
+                payload = _payload(row)
+                previous = journal.last(row_id)
+                if row_id in seen:
+                    write({'id': row_id, 'state': 'rejected', 'error': 'duplicate id'})
+                    continue
+                seen.add(row_id)
+                if previous is not None and previous['state'] in FINAL_STATES:
+                    if previous.get('digest', digest(payload)) != digest(payload):
+                        write({'id': row_id, 'state': 'rejected',
+                               'error': f'the row differs from the one journaled as {previous["state"]}, '
+                                        'not sending it again'})
+                    else:
+                        write(_result(previous, skipped=True))
+                    continue
+                if len(pending) >= concurrency * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        write(_result(future.result()))
+                pending.add(executor.submit(_payout, row_id, payload, url, token, journal, limiter))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write(_result(future.result()))
+    finally:
+        journal.close()
+    return counts
@@ -0,0 +1,125 @@
+"""
+Retry, hedging and circuit breaker state shared by transport and
+aio.transport.
+
+Requests marked idempotent (stellar.toml, /info, /fee, transaction lookups)
+are hedged: when no answer came within the host's recent p95 latency, a
+duplicate request is sent and the first good answer wins. Connection errors,
+429 and 5xx answers are retried with jittered exponential backoff.
+
+Every request to a host, idempotent or not, feeds its circuit breaker:
+after settings.HTTP_BREAKER_THRESHOLD failures in a row (connection error or
+5xx), requests to the host fail at once with CircuitOpenError for
+settings.HTTP_BREAKER_COOLDOWN seconds, then a single trial request decides
+whether the circuit closes again.
+"""
+import collections
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import settings
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# latencies kept per host, and needed before the p95 replaces settings.HTTP_HEDGE_DELAY
+LATENCY_SAMPLES = 200
+MIN_LATENCY_SAMPLES = 20
+
+
+class CircuitOpenError(ConnectionError):
+    pass
+
+
+class _Host:
+
+    def __init__(self):
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+
+_hosts = collections.defaultdict(_Host)
+_lock = threading.Lock()
+
+
+def _host_name(url):
+    return urlsplit(url).netloc
+
+
+def before(url):
+    """
+    Raises CircuitOpenError if the circuit of url's host is open.
+    """
+    host_name = _host_name(url)
+    with _lock:
+        host = _hosts[host_name]
+        if host.opened_at is None:
+            return
+        if time.monotonic() - host.opened_at < settings.HTTP_BREAKER_COOLDOWN or host.probing:
+            raise CircuitOpenError(f'Too many failed requests to {host_name}, not retrying yet')
+        # half open, this request is the trial
+        host.probing = True
+
+
+def after(url, elapsed, failed):
+    """
+    Records the outcome of a request to url.
+    """
+    with _lock:
+        host = _hosts[_host_name(url)]
+        host.probing = False
+        if not failed:
+            host.latencies.append(elapsed)
+            host.failures = 0
+            host.opened_at = None
+            return
+        host.failures += 1
+        if host.opened_at is not None or host.failures >= settings.HTTP_BREAKER_THRESHOLD:
+            host.opened_at = time.monotonic()
+
+
+def release(url):
+    """
+    Records that a request to url was abandoned without outcome.
+    """
+    with _lock:
+        _hosts[_host_name(url)].probing = False
+
+
+def is_failure(status_code):
+    return status_code is None or status_code >= 500
+
+
+def is_retryable(status_code):
+    return status_code in RETRYABLE_STATUSES
+
+
+def hedge_delay(url):
+    """
+    Returns the seconds to wait for an answer before hedging a request to
+    url: the p95 of the host's recent latencies. Returns None while the
+    host's circuit isn't closed, when a duplicate would fail at once.
+    """
+    with _lock:
+        host = _hosts[_host_name(url)]
+        if host.opened_at is not None:
+            return None
+        latencies = sorted(host.latencies)
+    if len(latencies) < MIN_LATENCY_SAMPLES:
+        return settings.HTTP_HEDGE_DELAY
+    return latencies[int(len(latencies) * 0.95)]
+
+
+def backoff(attempt, retry_after=None):
+    """
+    Returns the seconds to wait before retry number attempt (from 0), with
+    full jitter, or the server's Retry-After when it is shorter than
+    settings.HTTP_BACKOFF_MAX.
+    """
+    try:
+        if retry_after is not None and 0 <= float(retry_after) <= settings.HTTP_BACKOFF_MAX:
+            return float(retry_after)
+    except ValueError:
+        pass
+    return random.uniform(0, min(settings.HTTP_BACKOFF_MAX, settings.HTTP_BACKOFF * 2 ** attempt))
@@ -1,9 +1,63 @@
-import requests
+import time
+import transport
 import toml
+import cache
 import settings
 from utils import urljoin
 
+_STELLAR_TOMLS = {}
+
+
+def _cached(anchor_domain):
+    return _STELLAR_TOMLS.get(anchor_domain) or cache.load('stellar_toml', anchor_domain)
+
+
+def _url(anchor_domain):
+    return urljoin(f'{settings.STELLAR_TOML_SCHEME}://{anchor_domain}', '.well-known/stellar.toml')
+
+
+def _conditional_headers(entry):
+    if entry is not None and entry.get('etag'):
+        return {'If-None-Match': entry['etag']}
+    return {}
+
+
+def _update(anchor_domain, entry, response):
+    """
+    Stores the stellar.toml received in response and returns its content.
+    entry is the stale cached entry the request was conditional on, if any.
+    """
+    if response.status_code == 304 and entry is not None:
+        data = entry['data']
+    else:
+        response.raise_for_status()
+        data = toml.loads(response.text)
+
+    max_age = cache.max_age(response.headers, settings.STELLAR_TOML_TTL)
+    entry = {
+        'data': data,
+        'etag': response.headers.get('ETag') or (entry or {}).get('etag'),
+        'expires': time.time() + (max_age or 0),
+    }
+    _STELLAR_TOMLS[anchor_domain] = entry
+    if max_age is not None:
+        cache.store('stellar_toml', anchor_domain, entry)
+    return data
+
+
 def fetch_stellar_toml(anchor_domain=None):
+    """
+    Returns the parsed stellar.toml of anchor_domain.
+
+    Results are memoized for the process and cached on disk for
+    settings.STELLAR_TOML_TTL seconds (or the response's Cache-Control
+    max-age). Stale entries are revalidated with If-None-Match.
+    """
     anchor_domain = anchor_domain if anchor_domain is not None else settings.ANCHOR_DOMAIN
-    url = urljoin(f'https://{anchor_domain}', '.well-known/stellar.toml')
-    return toml.loads(requests.get(url).text)
+    entry = _cached(anchor_domain)
+    if cache.is_fresh(entry):
+        _STELLAR_TOMLS[anchor_domain] = entry
+        return entry['data']
+    response = transport.get(_url(anchor_domain), idempotent=True,
+                             headers=_conditional_headers(entry))
+    return _update(anchor_domain, entry, response)
@@ -1,30 +1,74 @@
 import json
-import requests
+import transport
 from stellar_sdk.keypair import Keypair
 from stellar_sdk.transaction_envelope import TransactionEnvelope
 from sep1 import fetch_stellar_toml
 import settings
+import tracing
 
 
-def auth():
+def sign_challenge(content, client_signing_key):
+    """
+    Signs the challenge transaction returned by the WEB_AUTH_ENDPOINT and
+    returns the body to post back.
+    """
+    envelope_xdr = content['transaction']
+    with tracing.span('sign challenge'):
+        envelope_object = TransactionEnvelope.from_xdr(
+            envelope_xdr, network_passphrase=settings.NETWORK_PASSPHRASE
+        )
+        envelope_object.sign(client_signing_key)
+        return {"transaction": envelope_object.to_xdr()}
+
+
+def verify_and_sign(challenge_xdr, secret, server_account_id, network_passphrase):
+    """
+    Checks that challenge_xdr is a challenge of server_account_id for the
+    account of secret, and returns it signed by that account. Runs in the
+    worker processes of aio.sep10.auth_many().
+    """
+    from stellar_sdk.sep.stellar_web_authentication import read_challenge_transaction
+    client_signing_key = Keypair.from_secret(secret)
+    envelope_object, client_account_id = read_challenge_transaction(
+        challenge_xdr, server_account_id, network_passphrase)
+    if client_account_id != client_signing_key.public_key:
+        raise ValueError(f'The challenge is for {client_account_id}')
+    envelope_object.sign(client_signing_key)
+    return envelope_object.to_xdr()
+
+
+def auth(secret=None):
     stellar_toml = fetch_stellar_toml()
     auth_url = stellar_toml['WEB_AUTH_ENDPOINT']
 
     # get challenge transaction and sign it
-    client_signing_key = Keypair.from_secret(settings.SECRET)
-    response = requests.get(f'{auth_url}?account={client_signing_key.public_key}')
+    client_signing_key = Keypair.from_secret(secret or settings.SECRET)
+    # each challenge is a transaction built and signed by the anchor: retried, never duplicated
+    response = transport.get(f'{auth_url}?account={client_signing_key.public_key}', idempotent=True,
+                             hedged=False)
     content = json.loads(response.content)
-    envelope_xdr = content['transaction']
-    envelope_object = TransactionEnvelope.from_xdr(
-        envelope_xdr, network_passphrase=settings.NETWORK_PASSPHRASE
-    )
-    envelope_object.sign(client_signing_key)
-    client_signed_envelope_xdr = envelope_object.to_xdr()
 
     # submit the signed transaction to prove ownership of the account
-    response = requests.post(
+    response = transport.post(
         auth_url,
-        json={"transaction": client_signed_envelope_xdr},
+        json=sign_challenge(content, client_signing_key),
     )
     content = json.loads(response.content)
     return content['token']
+
+
+def auth_many(secrets, concurrency=None, force=False):
+    """
+    aio.sep10.auth_many() for callers without an event loop.
+    """
+    import asyncio
+    import aio
+    from aio import sep10
+
+    async def _run():
+        try:
+            return await sep10.auth_many(secrets, concurrency, force)
+        finally:
+            await aio.close()
+
+    return asyncio.run(_run())
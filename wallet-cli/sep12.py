@@ -1,12 +1,15 @@
-import requests
-from sep10 import auth
+from concurrent.futures import ThreadPoolExecutor
+import settings
+import transport
+from multipart import MultipartBody
 from sep1 import fetch_stellar_toml
+from tokens import get_token
 from utils import urljoin
 
 
 def _headers(token):
     return {
-        'Authorization': 'Bearer ' + (token or auth())
+        'Authorization': 'Bearer ' + (token or get_token())
     }
 
 
@@ -16,13 +19,51 @@ def customer_get(params: dict, token=None):
     if server is None:
         server = stellar_toml['TRANSFER_SERVER']
     url = urljoin(server, 'customer')
-    return requests.get(url, params=params, headers=_headers(token)).json()
+    return transport.get(url, idempotent=True, params=params, headers=_headers(token)).json()
 
 
-def customer_put(params: dict, token=None):
+def customer_put(params: dict, token=None, files=None):
+    """
+    PUTs params, and files ({field: path}, ex: {"photo_id_front":
+    "id.jpg"}) streamed from disk as multipart/form-data.
+    """
     stellar_toml = fetch_stellar_toml()
     server = stellar_toml.get('KYC_SERVER')
     if server is None:
         server = stellar_toml['TRANSFER_SERVER']
     url = urljoin(server, 'customer')
-    return requests.put(url, data=params, headers=_headers(token)).json()
+    if not files:
+        return transport.put(url, data=params, headers=_headers(token)).json()
+    body = MultipartBody(params, files)
+    headers = dict(_headers(token), **{'Content-Type': body.content_type})
+    try:
+        return transport.put(url, data=body, headers=headers).json()
+    finally:
+        body.close()
+
+
+def _customer_put_item(item):
+    result = {'id': item.get('id') if isinstance(item, dict) else None}
+    try:
+        if not isinstance(item, dict):
+            raise TypeError('item must be a JSON object')
+        params, files = item.get('params') or {}, item.get('files') or {}
+        if not isinstance(params, dict) or not isinstance(files, dict):
+            raise TypeError('params and files must be JSON objects')
+        result['result'] = customer_put(params, item.get('token'), files)
+        result['status'] = 'ok'
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = f'{type(e).__name__}: {e}'
+    return result
+
+
+def customer_put_many(items, concurrency=None):
+    """
+    Runs customer_put() for each of items ({"id", "params", "files",
+    "token"}) with at most concurrency (default settings.BATCH_CONCURRENCY)
+    uploads at a time over the shared connection pool, and yields one
+    result per item, in order.
+    """
+    with ThreadPoolExecutor(concurrency or settings.BATCH_CONCURRENCY) as executor:
+        yield from executor.map(_customer_put_item, items)
@@ -1,46 +1,49 @@
-import requests
-from sep10 import auth
+import fees
+import transport
 from sep1 import fetch_stellar_toml
+from tokens import get_token
 from utils import urljoin
 
 
 def _headers(token):
     return {
-        'Authorization': 'Bearer ' + (token or auth())
+        'Authorization': 'Bearer ' + (token or get_token())
     }
 
 
 def deposit(params, token=None):
+    fees.check('sep24', 'deposit', params)
     stellar_toml = fetch_stellar_toml()
     url = urljoin(stellar_toml['TRANSFER_SERVER_SEP0024'], 'transactions/deposit/interactive')
-    return requests.post(url, data=params, headers=_headers(token)).json()
+    return transport.post(url, data=params, headers=_headers(token)).json()
 
 
 def withdraw(params, token=None):
+    fees.check('sep24', 'withdraw', params)
     stellar_toml = fetch_stellar_toml()
     url = urljoin(stellar_toml['TRANSFER_SERVER_SEP0024'], 'transactions/withdraw/interactive')
-    return requests.post(url, data=params, headers=_headers(token)).json()
+    return transport.post(url, data=params, headers=_headers(token)).json()
 
 
 def info():
     stellar_toml = fetch_stellar_toml()
     url = urljoin(stellar_toml['TRANSFER_SERVER_SEP0024'], 'info')
-    return requests.get(url).json()
+    return transport.get(url, idempotent=True, cached=True).json()
 
 
 def fee(params):
     stellar_toml = fetch_stellar_toml()
     url = urljoin(stellar_toml['TRANSFER_SERVER_SEP0024'], 'fee')
-    return requests.get(url, params=params).json()
+    return transport.get(url, idempotent=True, cached=True, params=params).json()
 
 
 def transaction(params, token=None):
     stellar_toml = fetch_stellar_toml()
     url = urljoin(stellar_toml['TRANSFER_SERVER_SEP0024'], 'transaction')
-    return requests.get(url, params=params, headers=_headers(token)).json()
+    return transport.get(url, idempotent=True, params=params, headers=_headers(token)).json()
 
 
 def transactions(params, token=None):
     stellar_toml = fetch_stellar_toml()
     url = urljoin(stellar_toml['TRANSFER_SERVER_SEP0024'], 'transactions')
-    return requests.get(url, params=params, headers=_headers(token)).json()
+    return transport.get(url, idempotent=True, params=params, headers=_headers(token)).json()
@@ -1,46 +1,49 @@
-import requests
+import fees
+import transport
 from sep1 import fetch_stellar_toml
-from sep10 import auth
+from tokens import get_token
 from utils import urljoin
 
 
 def _headers(token):
     return {
-        'Authorization': 'Bearer ' + (token or auth())
+        'Authorization': 'Bearer ' + (token or get_token())
     }
 
 
 def deposit(params, token=None):
+    fees.check('sep6', 'deposit', params)
     stellar_toml = fetch_stellar_toml()
     url = urljoin(stellar_toml['TRANSFER_SERVER'], 'deposit')
-    return requests.get(url, params=params, headers=_headers(token)).json()
+    return transport.get(url, params=params, headers=_headers(token)).json()
 
 
 def withdraw(params, token=None):
+    fees.check('sep6', 'withdraw', params)
     stellar_toml = fetch_stellar_toml()
     url = urljoin(stellar_toml['TRANSFER_SERVER'], 'withdraw')
-    return requests.get(url, params=params, headers=_headers(token)).json()
+    return transport.get(url, params=params, headers=_headers(token)).json()
 
 
 def info():
     stellar_toml = fetch_stellar_toml()
     url = urljoin(stellar_toml['TRANSFER_SERVER'], 'info')
-    return requests.get(url).json()
+    return transport.get(url, idempotent=True, cached=True).json()
 
 
 def fee(params):
     stellar_toml = fetch_stellar_toml()
     url = urljoin(stellar_toml['TRANSFER_SERVER'], 'fee')
-    return requests.get(url, params=params).json()
+    return transport.get(url, idempotent=True, cached=True, params=params).json()
 
 
 def transaction(params, token=None):
     stellar_toml = fetch_stellar_toml()
     url = urljoin(stellar_toml['TRANSFER_SERVER'], 'transaction')
-    return requests.get(url, params=params, headers=_headers(token)).json()
+    return transport.get(url, idempotent=True, params=params, headers=_headers(token)).json()
 
 
 def transactions(params, token=None):
     stellar_toml = fetch_stellar_toml()
     url = urljoin(stellar_toml['TRANSFER_SERVER'], 'transactions')
-    return requests.get(url, params=params, headers=_headers(token)).json()
+    return transport.get(url, idempotent=True, params=params, headers=_headers(token)).json()
@@ -1,17 +1,87 @@
 import os
 from pathlib import Path
-from stellar_sdk.keypair import Keypair
-from stellar_sdk.network import Network
-from stellar_sdk.server import Server
 
 DATABASE_NAME = 'database.bin'
 DATABASE_PATH = os.path.join(Path(__file__).parent.absolute(), DATABASE_NAME)
+TOKENS_DIR = os.path.join(Path(__file__).parent.absolute(), 'tokens')
+HISTORY_PATH = os.path.join(Path(__file__).parent.absolute(), 'history.db')
+CACHE_DIR = os.getenv('WALLET_CLI_CACHE_DIR', os.path.join(Path(__file__).parent.absolute(), 'cache'))
 
-def init(anchor_domain, stellar_network, secret):
+# only meant for local test servers, see mockanchor.py
+STELLAR_TOML_SCHEME = os.getenv('WALLET_CLI_STELLAR_TOML_SCHEME', 'https')
+HORIZON_URL = os.getenv('WALLET_CLI_HORIZON_URL')
+
+# seconds a fetched stellar.toml is reused when the anchor sends no max-age
+STELLAR_TOML_TTL = int(os.getenv('WALLET_CLI_STELLAR_TOML_TTL', 3600))
+# seconds before a SEP-10 token expires at which it is refreshed
+TOKEN_REFRESH_MARGIN = int(os.getenv('WALLET_CLI_TOKEN_REFRESH_MARGIN', 60))
+
+# HTTP transport, see transport.py
+HTTP_POOL_CONNECTIONS = int(os.getenv('WALLET_CLI_HTTP_POOL_CONNECTIONS', 10))
+HTTP_POOL_MAXSIZE = int(os.getenv('WALLET_CLI_HTTP_POOL_MAXSIZE', 10))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('WALLET_CLI_HTTP_CONNECT_TIMEOUT', 5))
+HTTP_READ_TIMEOUT = float(os.getenv('WALLET_CLI_HTTP_READ_TIMEOUT', 30))
+HTTP_ASYNC_LIMIT = int(os.getenv('WALLET_CLI_HTTP_ASYNC_LIMIT', 100))
+HTTP_RETRIES = int(os.getenv('WALLET_CLI_HTTP_RETRIES', 2))
+DNS_TTL = int(os.getenv('WALLET_CLI_DNS_TTL', 300))
+# GET responses kept on disk, see httpcache.py
+HTTP_CACHE_TTL = int(os.getenv('WALLET_CLI_HTTP_CACHE_TTL', 300))
+HTTP_CACHE_MAX_SIZE = int(os.getenv('WALLET_CLI_HTTP_CACHE_MAX_SIZE', 50 * 1024 * 1024))
+# idempotent requests, see resilience.py
+HTTP_IDEMPOTENT_RETRIES = int(os.getenv('WALLET_CLI_HTTP_IDEMPOTENT_RETRIES', 2))
+HTTP_BACKOFF = float(os.getenv('WALLET_CLI_HTTP_BACKOFF', 0.2))
+HTTP_BACKOFF_MAX = float(os.getenv('WALLET_CLI_HTTP_BACKOFF_MAX', 5))
+# seconds before hedging while a host has too few latency samples, 0 disables hedging
+HTTP_HEDGE_DELAY = float(os.getenv('WALLET_CLI_HTTP_HEDGE_DELAY', 1))
+HTTP_HEDGE_WORKERS = int(os.getenv('WALLET_CLI_HTTP_HEDGE_WORKERS', 64))
+HTTP_BREAKER_THRESHOLD = int(os.getenv('WALLET_CLI_HTTP_BREAKER_THRESHOLD', 5))
+HTTP_BREAKER_COOLDOWN = float(os.getenv('WALLET_CLI_HTTP_BREAKER_COOLDOWN', 30))
+
+# seconds a cached account state (sequence, balances) is used before reloading it
+ACCOUNT_STATE_TTL = int(os.getenv('WALLET_CLI_ACCOUNT_STATE_TTL', 300))
+
+# operations run at the same time by `cli.py batch`
+BATCH_CONCURRENCY = int(os.getenv('WALLET_CLI_BATCH_CONCURRENCY', 16))
+# transactions requested per page by `cli.py history sync`
+HISTORY_PAGE_SIZE = int(os.getenv('WALLET_CLI_HISTORY_PAGE_SIZE', 200))
+# SEP-31 transactions created per second by `cli.py sep31 payout`, 0 for no limit
+PAYOUT_RATE = float(os.getenv('WALLET_CLI_PAYOUT_RATE', 0))
+# seconds each anchor has to answer `cli.py compare`
+COMPARE_TIMEOUT = float(os.getenv('WALLET_CLI_COMPARE_TIMEOUT', 5))
+# seconds without data before an event stream is reopened, see sse.py
+STREAM_READ_TIMEOUT = float(os.getenv('WALLET_CLI_STREAM_READ_TIMEOUT', 120))
+# transaction status polling, see watch.py
+WATCH_BACKOFF = float(os.getenv('WALLET_CLI_WATCH_BACKOFF', 1.5))
+WATCH_MAX_INTERVAL = float(os.getenv('WALLET_CLI_WATCH_MAX_INTERVAL', 600))
+
+def init(anchor_domain, stellar_network, secret, account=None):
     globals()['STELLAR_NETWORK'] = stellar_network
     globals()['ANCHOR_DOMAIN'] = anchor_domain
-    globals()['NETWORK_PASSPHRASE'] = Network.TESTNET_NETWORK_PASSPHRASE if stellar_network == 'TESTNET' else Network.PUBLIC_NETWORK_PASSPHRASE
-    globals()['HORIZON_SERVER'] = Server(horizon_url='https://horizon-testnet.stellar.org/') if stellar_network == 'TESTNET' else Server(horizon_url='https://horizon.stellar.org/')
-
     globals()['SECRET'] = secret
-    globals()['PUBKEY'] = Keypair.from_secret(secret).public_key
+    for name in ('NETWORK_PASSPHRASE', 'HORIZON_SERVER', 'PUBKEY'):
+        globals().pop(name, None)
+    if account is not None:
+        globals()['PUBKEY'] = account
+
+
+def __getattr__(name):
+    """
+    Settings derived from init() values are computed on first access, so
+    commands which don't need them never import stellar_sdk.
+    """
+    if name not in ('NETWORK_PASSPHRASE', 'HORIZON_SERVER', 'PUBKEY') or 'SECRET' not in globals():
+        raise AttributeError(f"module 'settings' has no attribute '{name}'")
+    if name == 'NETWORK_PASSPHRASE':
+        from stellar_sdk.network import Network
+        value = Network.TESTNET_NETWORK_PASSPHRASE if STELLAR_NETWORK == 'TESTNET' else Network.PUBLIC_NETWORK_PASSPHRASE
+    elif name == 'HORIZON_SERVER':
+        from stellar_sdk.server import Server
+        if HORIZON_URL:
+            value = Server(horizon_url=HORIZON_URL)
+        else:
+            value = Server(horizon_url='https://horizon-testnet.stellar.org/') if STELLAR_NETWORK == 'TESTNET' else Server(horizon_url='https://horizon.stellar.org/')
+    else:
+        from stellar_sdk.keypair import Keypair
+        value = Keypair.from_secret(SECRET).public_key
+    globals()[name] = value
+    return value
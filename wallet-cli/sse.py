@@ -0,0 +1,93 @@
+"""
+Server-sent events client over the shared transport.
+
+events() keeps a stream open and yields its events as they arrive,
+reconnecting from the last event id (Last-Event-ID header) when the server
+closes the stream or the connection fails. Reconnections wait for the
+server's retry delay, and failed ones back off exponentially, see
+resilience.backoff(). 4xx answers other than 429 won't change by
+reconnecting, so they are raised.
+"""
+import time
+import requests
+import resilience
+import settings
+import transport
+
+# seconds before reconnecting when the server gave no retry delay
+DEFAULT_RETRY = 1
+
+
+def parse(chunks):
+    """
+    Yields the events, {"id", "event", "data", "retry"}, of a stream made of
+    the byte chunks.
+    """
+    buffer = b''
+    event = {}
+    data = []
+    for chunk in chunks:
+        buffer += chunk
+        lines = buffer.splitlines(keepends=True)
+        # keep an unfinished line, or a \r which may be followed by \n
+        buffer = lines.pop() if lines and not lines[-1].endswith(b'\n') else b''
+        for line in lines:
+            line = line.rstrip(b'\r\n').decode()
+            if not line:
+                if data or 'retry' in event:
+                    event['data'] = '\n'.join(data)
+                    yield event
+                event = {}
+                data = []
+                continue
+            if line.startswith(':'):
+                # comment, used as keep-alive
+                continue
+            field, _, value = line.partition(':')
+            value = value[1:] if value.startswith(' ') else value
+            if field == 'data':
+                data.append(value)
+            elif field in ('id', 'event'):
+                event[field] = value
+            elif field == 'retry' and value.isdigit():
+                event['retry'] = int(value)
+
+
+def events(url, params=None, last_event_id=None):
+    """
+    Yields the events of the stream at url forever. Each event has the id of
+    the last event received, so callers can save it and restart from it.
+    Raises requests.HTTPError on 4xx answers other than 429.
+    """
+    retry = DEFAULT_RETRY
+    attempt = 0
+    while True:
+        headers = {'Accept': 'text/event-stream', 'Cache-Control': 'no-cache',
+                   # compressed streams would be buffered
+                   'Accept-Encoding': 'identity'}
+        if last_event_id is not None:
+            headers['Last-Event-ID'] = last_event_id
+        delay = retry
+        try:
+            with transport.get(url, params=params, headers=headers, stream=True,
+                               timeout=(settings.HTTP_CONNECT_TIMEOUT, settings.STREAM_READ_TIMEOUT)) as response:
+                response.raise_for_status()
+                # chunk_size=None yields each chunk of a chunked response as it arrives
+                for event in parse(response.iter_content(chunk_size=None)):
+                    attempt = 0
+                    if 'retry' in event:
+                        retry = event['retry'] / 1000
+                    if 'id' in event:
+                        last_event_id = event['id']
+                    event['id'] = last_event_id
+                    yield event
+        except requests.HTTPError as e:
+            status = e.response.status_code
+            if status < 500 and status != 429:
+                raise
+            delay = max(retry, resilience.backoff(attempt, e.response.headers.get('Retry-After')))
+            attempt += 1
+        except (requests.RequestException, ConnectionError):
+            delay = max(retry, resilience.backoff(attempt))
+            attempt += 1
+        time.sleep(delay)
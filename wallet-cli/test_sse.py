@@ -0,0 +1,74 @@
+import json
+import types
+import pytest
+import requests
+import mockanchor
+import sse
+
+ACCOUNT = 'GDESTINATION'
+
+
+@pytest.fixture
+def anchor():
+    server = mockanchor.MockAnchor().start()
+    server.stream_timeout = 0.2
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(sse, 'time', types.SimpleNamespace(sleep=delays.append))
+    return delays
+
+
+def payments_url(anchor):
+    return f'{anchor.url}/horizon/accounts/{ACCOUNT}/payments'
+
+
+def payments(stream, count):
+    result = []
+    for event in stream:
+        if 'event' not in event:
+            result.append(event)
+            if len(result) == count:
+                return result
+
+
+def test_resumes_from_last_event_id_after_retry_delay(anchor, monkeypatch):
+    anchor.add_payment(ACCOUNT, mockanchor.ASSET_CODE, 1)
+    delays = []
+
+    def sleep(delay):
+        # paid while disconnected, only sent again from the last event id
+        delays.append(delay)
+        anchor.add_payment(ACCOUNT, mockanchor.ASSET_CODE, len(delays) + 1)
+    monkeypatch.setattr(sse, 'time', types.SimpleNamespace(sleep=sleep))
+
+    received = payments(sse.events(payments_url(anchor), last_event_id='0'), 3)
+    assert [event['id'] for event in received] == ['1', '2', '3']
+    assert [json.loads(event['data'])['amount'] for event in received] == ['1', '2', '3']
+    # the stream's "retry: 1000"
+    assert delays == [1.0, 1.0]
+
+
+def test_raises_on_client_error(anchor, sleeps):
+    with pytest.raises(requests.HTTPError):
+        next(sse.events(anchor.url + '/horizon/unknown'))
+    assert sleeps == []
+
+
+def test_reconnects_on_too_many_requests(anchor, sleeps, monkeypatch):
+    answers = [(429, {'error': 'slow down'})]
+    horizon_payments = mockanchor.Handler.horizon_payments
+
+    def rate_limited(self, account_id):
+        return answers.pop() if answers else horizon_payments(self, account_id)
+    monkeypatch.setattr(mockanchor.Handler, 'horizon_payments', rate_limited)
+    anchor.add_payment(ACCOUNT, mockanchor.ASSET_CODE, 1)
+
+    received = payments(sse.events(payments_url(anchor), last_event_id='0'), 1)
+    assert received[0]['id'] == '1'
+    assert len(sleeps) == 1
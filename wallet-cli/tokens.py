@@ -0,0 +1,164 @@
+"""
+SEP-10 token cache shared by every CLI process.
+
+Tokens are keyed by (anchor domain, network, account), reused until
+settings.TOKEN_REFRESH_MARGIN seconds before their JWT `exp`, and stored in
+settings.TOKENS_DIR in one file per account, encrypted with its secret:
+other accounts, which can't decrypt it, never replace it. An exclusive lock
+of the account's file is held while its token is refreshed, so concurrent
+processes wait for a single SEP-10 handshake instead of each doing their
+own, while tokens of other accounts are refreshed in parallel.
+"""
+import base64
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+import database
+import settings
+import tracing
+
+_TOKENS = {}
+# account: threading.Lock held while its token is refreshed
+_LOCKS = {}
+_LOCK = threading.Lock()
+_ACCOUNTS = {}
+
+
+def _key(account, anchor_domain=None, stellar_network=None):
+    anchor_domain = anchor_domain or settings.ANCHOR_DOMAIN
+    stellar_network = stellar_network or settings.STELLAR_NETWORK
+    return f'{anchor_domain}|{stellar_network}|{account}'
+
+
+def expires_at(token):
+    """
+    Returns the `exp` claim of a JWT, without verifying its signature.
+    """
+    payload = token.split('.')[1]
+    payload += '=' * (-len(payload) % 4)
+    return json.loads(base64.urlsafe_b64decode(payload))['exp']
+
+
+def is_valid(token):
+    if token is None:
+        return False
+    try:
+        return expires_at(token) - settings.TOKEN_REFRESH_MARGIN > time.time()
+    except (IndexError, KeyError, TypeError, ValueError):
+        return False
+
+
+def account(secret):
+    """
+    Returns the public key of secret.
+    """
+    public_key = _ACCOUNTS.get(secret)
+    if public_key is None:
+        from stellar_sdk.keypair import Keypair
+        public_key = _ACCOUNTS[secret] = Keypair.from_secret(secret).public_key
+    return public_key
+
+
+def _path(secret):
+    return os.path.join(settings.TOKENS_DIR, account(secret) + '.bin')
+
+
+def _thread_lock(secret):
+    with _LOCK:
+        return _LOCKS.setdefault(account(secret), threading.Lock())
+
+
+@contextmanager
+def locked(secret):
+    """
+    Holds the exclusive lock of the token file of secret's account, taken
+    while its token is refreshed. It is not reentrant.
+    """
+    os.makedirs(settings.TOKENS_DIR, exist_ok=True)
+    with open(_path(secret) + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read(secret):
+    try:
+        with open(_path(secret), 'rb') as file:
+            source = file.read()
+        with tracing.span('tokens decrypt'):
+            return json.loads(database.decrypt(secret.encode(), source).decode())
+    except (OSError, ValueError, IndexError):
+        return {}
+
+
+def _write(secret, store):
+    path = _path(secret)
+    with open(path + '.tmp', 'wb') as file:
+        file.write(database.encrypt(secret.encode(), json.dumps(store).encode()))
+    os.replace(path + '.tmp', path)
+
+
+def save(secret, token, holding_lock=False):
+    """
+    Stores the token of secret's account for the current anchor and
+    network. holding_lock must be True if the caller holds locked(secret).
+    """
+    if not holding_lock:
+        with _thread_lock(secret), locked(secret):
+            return save(secret, token, holding_lock=True)
+    key = _key(account(secret))
+    store = {k: v for k, v in _read(secret).items() if is_valid(v)}
+    store[key] = _TOKENS[key] = token
+    _write(secret, store)
+
+
+def update(tokens):
+    """
+    Stores {secret: token} pairs for the current anchor and network.
+    """
+    for secret, token in tokens.items():
+        save(secret, token)
+
+
+def lookup(secret):
+    """
+    Returns a still valid cached token for secret's account, or None.
+    """
+    key = _key(account(secret))
+    token = _TOKENS.get(key)
+    if is_valid(token):
+        return token
+    token = _read(secret).get(key)
+    if is_valid(token):
+        _TOKENS[key] = token
+        return token
+    return None
+
+
+def get_token(secret=None, rejected=None):
+    """
+    Returns a SEP-10 token for secret (default settings.SECRET), doing the
+    handshake only when no cached token is valid anymore. rejected is a token
+    the anchor refused, which is refreshed even if not expired.
+    """
+    secret = secret or settings.SECRET
+    key = _key(account(secret))
+    token = _TOKENS.get(key)
+    if is_valid(token) and token != rejected:
+        return token
+    with _thread_lock(secret):
+        with locked(secret):
+            # another thread or process may have refreshed it while we waited
+            token = lookup(secret)
+            if token is None or token == rejected:
+                from sep10 import auth
+                token = auth(secret)
+                if is_valid(token):
+                    save(secret, token, holding_lock=True)
+        _TOKENS[key] = token
+        return token
@@ -0,0 +1,270 @@
+"""
+Tracing of a command, for `cli.py --trace` and `--trace-file`.
+
+enable() records a span for each HTTP request made through transport,
+aio.transport and the Horizon client of stellar_sdk, split in phases:
+
+    dns      name resolution (0 when it came from the transport DNS cache)
+    connect  TCP connection
+    tls      TLS handshake (included in connect for the asyncio API)
+    send     writing the request
+    ttfb     waiting for the response headers
+    body     reading and decoding the response body
+
+Requests on a kept-alive connection have no dns/connect/tls phases. Local
+phases, such as decrypting the database or signing a transaction, are
+recorded by wrapping them in span(), which does nothing when tracing is
+disabled. report() prints the spans as a waterfall on stderr, or writes
+them to a JSON file.
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import sys
+import threading
+import time
+
+# None while tracing is disabled
+_spans = None
+_start = None
+_lock = threading.Lock()
+_installed = False
+# raw phase durations of the request running in the current thread or task
+_phases = contextvars.ContextVar('phases', default={})
+
+PHASES = ['dns', 'connect', 'tls', 'send', 'ttfb', 'body']
+WATERFALL_WIDTH = 40
+
+
+def enabled():
+    return _spans is not None
+
+
+def _add_phase(name, seconds):
+    phases = _phases.get()
+    # a new dict each time, so tasks and threads never share one
+    _phases.set({**phases, name: phases.get(name, 0) + seconds})
+
+
+def _take_phases():
+    phases = _phases.get()
+    _phases.set({})
+    return phases
+
+
+def _timed(name, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _spans is None:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _add_phase(name, time.perf_counter() - start)
+    return wrapper
+
+
+def _record(span):
+    with _lock:
+        if _spans is not None:
+            span['thread'] = threading.current_thread().name
+            _spans.append(span)
+
+
+def _http_span(method, url, status, elapsed):
+    end = time.perf_counter()
+    raw = _take_phases()
+    dns = raw.get('dns', 0)
+    phases = {'dns': dns} if 'new_conn' in raw else {}
+    if 'new_conn' in raw:
+        phases['connect'] = raw['new_conn'] - dns
+    if 'https_connect' in raw:
+        phases['tls'] = raw['https_connect'] - raw['new_conn']
+    if 'aio_connect' in raw:
+        phases['dns'] = dns
+        phases['connect'] = raw['aio_connect'] - dns
+    for name in ['send', 'ttfb']:
+        if name in raw:
+            phases[name] = raw[name]
+    phases['body'] = max(elapsed - sum(phases.values()), 0)
+    _record({
+        'name': f'{method} {url}',
+        'kind': 'http',
+        'method': method,
+        'url': url,
+        'status': status,
+        'start': end - elapsed - _start,
+        'duration': elapsed,
+        'phases': phases,
+    })
+
+
+def _hook(method, url, response, elapsed):
+    if _spans is not None:
+        _http_span(method, url, getattr(response, 'status_code', None), elapsed)
+
+
+def _traced_client_method(method, function):
+    @functools.wraps(function)
+    def wrapper(self, url, *args, **kwargs):
+        if _spans is None:
+            return function(self, url, *args, **kwargs)
+        _take_phases()
+        response = None
+        start = time.perf_counter()
+        try:
+            response = function(self, url, *args, **kwargs)
+            return response
+        finally:
+            _http_span(method, url, getattr(response, 'status_code', None), time.perf_counter() - start)
+    return wrapper
+
+
+def _install():
+    """
+    Instruments the HTTP stack, once per process.
+    """
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    import urllib3.connection
+    from stellar_sdk.client.requests_client import RequestsClient
+    import transport
+
+    transport.HOOKS.append(_hook)
+    # install the caching resolver now, so that every lookup goes through it
+    transport.session()
+    transport._getaddrinfo = _timed('dns', transport._getaddrinfo)
+
+    connection = urllib3.connection.HTTPConnection
+    connection._new_conn = _timed('new_conn', connection._new_conn)
+    connection.request = _timed('send', connection.request)
+    connection.getresponse = _timed('ttfb', connection.getresponse)
+    https_connection = urllib3.connection.HTTPSConnection
+    https_connection.connect = _timed('https_connect', https_connection.connect)
+
+    RequestsClient.get = _traced_client_method('GET', RequestsClient.get)
+    RequestsClient.post = _traced_client_method('POST', RequestsClient.post)
+
+
+def trace_configs():
+    """
+    Returns the aiohttp trace configs recording the phases of asyncio
+    requests, empty while tracing is disabled.
+    """
+    if _spans is None:
+        return []
+    import aiohttp
+
+    async def on_request_start(session, context, params):
+        _take_phases()
+        context.start = time.perf_counter()
+        context.connecting = 0
+
+    async def on_dns_resolvehost_start(session, context, params):
+        context.dns_start = time.perf_counter()
+
+    async def on_dns_resolvehost_end(session, context, params):
+        _add_phase('dns', time.perf_counter() - context.dns_start)
+
+    async def on_connection_create_start(session, context, params):
+        context.connect_start = time.perf_counter()
+
+    async def on_connection_create_end(session, context, params):
+        context.connecting = time.perf_counter() - context.connect_start
+        _add_phase('aio_connect', context.connecting)
+
+    async def on_request_end(session, context, params):
+        _add_phase('ttfb', time.perf_counter() - context.start - context.connecting)
+
+    config = aiohttp.TraceConfig()
+    config.on_request_start.append(on_request_start)
+    config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    config.on_connection_create_start.append(on_connection_create_start)
+    config.on_connection_create_end.append(on_connection_create_end)
+    config.on_request_end.append(on_request_end)
+    return [config]
+
+
+def enable():
+    """
+    Starts recording spans, dropping those of a previous trace.
+    """
+    global _spans, _start
+    _install()
+    with _lock:
+        _spans = []
+        _start = time.perf_counter()
+
+
+def disable():
+    """
+    Stops recording and returns the trace.
+    """
+    global _spans
+    with _lock:
+        spans, _spans = _spans or [], None
+    return {
+        'duration': time.perf_counter() - _start,
+        'round_trips': sum(1 for span in spans if span['kind'] == 'http'),
+        'new_connections': sum(1 for span in spans if 'connect' in span.get('phases', {})),
+        'spans': sorted(spans, key=lambda span: span['start']),
+    }
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """
+    Records the time spent in the with block as a local phase.
+    """
+    if _spans is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        _record(dict(attributes, name=name, kind='local', start=start - _start, duration=end - start))
+
+
+def _ms(seconds):
+    return '{:.0f}'.format(seconds * 1000)
+
+
+def waterfall(trace, file=sys.stderr):
+    """
+    Prints trace as one line per span, with a bar placing it in the run.
+    """
+    total = max(trace['duration'], 1e-9)
+    for span in trace['spans']:
+        offset = int(span['start'] / total * WATERFALL_WIDTH)
+        length = max(1, round(span['duration'] / total * WATERFALL_WIDTH))
+        bar = (' ' * offset + '#' * length)[:WATERFALL_WIDTH].ljust(WATERFALL_WIDTH)
+        name = span['name']
+        if span['kind'] == 'http':
+            name += f' {span["status"] if span["status"] is not None else "failed"}'
+            phases = ' '.join(f'{phase} {_ms(span["phases"][phase])}'
+                              for phase in PHASES if phase in span['phases'])
+            name += f' ({phases})'
+        print(f'{_ms(span["start"]):>6} ms |{bar}| {_ms(span["duration"]):>5} ms  {name}', file=file)
+    print(f'{trace["round_trips"]} HTTP round trips, {trace["new_connections"]} new connections, '
+          f'{_ms(trace["duration"])} ms', file=file)
+
+
+def report(path=None):
+    """
+    Stops recording, and writes the trace to path as JSON, or prints it as
+    a waterfall on stderr.
+    """
+    trace = disable()
+    if path is None:
+        waterfall(trace)
+        return
+    with open(path, 'w') as file:
+        json.dump(trace, file, indent=2)
@@ -0,0 +1,225 @@
+"""
+HTTP transport shared by every SEP module.
+
+All requests go through one requests.Session holding a keep-alive pool per
+host, so repeated calls to the same anchor reuse their TCP+TLS connection.
+Name resolutions are cached for settings.DNS_TTL seconds, every request gets
+default connect/read timeouts, and functions in HOOKS are called after each
+request with (method, url, response, elapsed) for instrumentation.
+
+Requests made with idempotent=True are hedged (unless hedged=False) and
+retried, and every request goes through the host's circuit breaker, see
+resilience.py. GET responses of
+requests made with cached=True are kept on disk, see httpcache.py, and
+concurrent misses of the same response share a single request.
+"""
+import socket
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import resilience
+import settings
+
+HOOKS = []
+
+_session = None
+_session_lock = threading.Lock()
+_executor = None
+# cache key: Future of the request fetching it
+_flights = {}
+_flights_lock = threading.Lock()
+_getaddrinfo = socket.getaddrinfo
+_addresses = {}
+
+
+def _cached_getaddrinfo(host, port, *args, **kwargs):
+    key = (host, port, args, tuple(sorted(kwargs.items())))
+    entry = _addresses.get(key)
+    now = time.monotonic()
+    if entry is not None and entry[0] > now:
+        return entry[1]
+    addresses = _getaddrinfo(host, port, *args, **kwargs)
+    _addresses[key] = (now + settings.DNS_TTL, addresses)
+    return addresses
+
+
+def session():
+    """
+    Returns the process wide session, creating it on first use.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            socket.getaddrinfo = _cached_getaddrinfo
+            adapter = HTTPAdapter(
+                pool_connections=settings.HTTP_POOL_CONNECTIONS,
+                pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+                # only retry when the request could not reach the server
+                max_retries=Retry(total=None, connect=settings.HTTP_RETRIES,
+                                  read=0, status=0, backoff_factor=0.1),
+            )
+            _session = requests.Session()
+            _session.headers['Accept-Encoding'] = 'gzip, deflate'
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def _hedge_executor():
+    global _executor
+    with _session_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.HTTP_HEDGE_WORKERS, thread_name_prefix='hedge')
+        return _executor
+
+
+def _send(method, url, kwargs):
+    resilience.before(url)
+    response = None
+    start = time.perf_counter()
+    try:
+        response = session().request(method, url, **kwargs)
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        resilience.after(url, elapsed, resilience.is_failure(getattr(response, 'status_code', None)))
+        for hook in HOOKS:
+            hook(method, url, response, elapsed)
+
+
+def _is_good(future):
+    return future.exception() is None and not resilience.is_retryable(future.result().status_code)
+
+
+def _hedged(method, url, kwargs):
+    """
+    Sends the request, and a duplicate if no answer came within the hedge
+    delay of its start. Returns the first good answer, else the last one.
+    """
+    if not settings.HTTP_HEDGE_DELAY:
+        return _send(method, url, kwargs)
+    executor = _hedge_executor()
+    started = threading.Event()
+
+    def send():
+        started.set()
+        return _send(method, url, kwargs)
+
+    pending = {executor.submit(send)}
+    # time spent queued behind busy workers doesn't count
+    started.wait()
+    delay = resilience.hedge_delay(url)
+    if delay is None:
+        return pending.pop().result()
+    done, pending = wait(pending, timeout=delay)
+    if not done:
+        pending.add(executor.submit(_send, method, url, kwargs))
+    while pending:
+        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+        done |= finished
+        for future in finished:
+            if _is_good(future):
+                return future.result()
+    return done.pop().result()
+
+
+def _resilient(method, url, kwargs, hedged=True):
+    for attempt in range(settings.HTTP_IDEMPOTENT_RETRIES + 1):
+        last = attempt == settings.HTTP_IDEMPOTENT_RETRIES
+        retry_after = None
+        try:
+            response = _hedged(method, url, kwargs) if hedged else _send(method, url, kwargs)
+        except resilience.CircuitOpenError:
+            raise
+        except requests.RequestException:
+            if last:
+                raise
+        else:
+            if last or not resilience.is_retryable(response.status_code):
+                return response
+            retry_after = response.headers.get('Retry-After')
+        time.sleep(resilience.backoff(attempt, retry_after))
+
+
+def _stored_response(url, entry):
+    response = requests.Response()
+    response.status_code = entry['status']
+    response.headers = requests.structures.CaseInsensitiveDict(entry['headers'])
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response.url = url
+    response._content = entry['body']
+    return response
+
+
+def _cached(method, url, idempotent, hedged, kwargs):
+    import httpcache
+    cache_key = httpcache.key(url, kwargs.get('params'))
+    entry = httpcache.lookup(cache_key)
+    if entry is not None and entry['expires'] > time.time():
+        return _stored_response(url, entry)
+
+    with _flights_lock:
+        flight = _flights.get(cache_key)
+        leading = flight is None
+        if leading:
+            flight = _flights[cache_key] = Future()
+    if not leading:
+        response = flight.result()
+        return _stored_response(url, {'status': response.status_code, 'headers': response.headers,
+                                      'body': response.content})
+    try:
+        response = _fetch(method, url, idempotent, hedged, kwargs, cache_key, entry)
+        flight.set_result(response)
+        return response
+    except BaseException as e:
+        flight.set_exception(e)
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[cache_key]
+
+
+def _fetch(method, url, idempotent, hedged, kwargs, cache_key, entry):
+    """
+    Fetches or revalidates the stale or missing entry of cache_key.
+    """
+    import httpcache
+    if entry is not None and entry['etag']:
+        kwargs = dict(kwargs, headers=dict(kwargs.get('headers') or {}, **{'If-None-Match': entry['etag']}))
+
+    response = _resilient(method, url, kwargs, hedged) if idempotent else _send(method, url, kwargs)
+    if response.status_code == 304 and entry is not None:
+        httpcache.revalidated(cache_key, response.headers)
+        return _stored_response(url, entry)
+    if response.status_code == 200:
+        httpcache.store(cache_key, response.status_code, response.headers, response.content)
+    return response
+
+
+def request(method, url, idempotent=False, cached=False, hedged=True, **kwargs):
+    kwargs.setdefault('timeout', (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT))
+    # responses depending on who asks are never shared
+    if cached and method == 'GET' and 'Authorization' not in (kwargs.get('headers') or {}):
+        return _cached(method, url, idempotent, hedged, kwargs)
+    if idempotent:
+        return _resilient(method, url, kwargs, hedged)
+    return _send(method, url, kwargs)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request('PUT', url, **kwargs)
+
+
+def patch(url, **kwargs):
+    return request('PATCH', url, **kwargs)
@@ -1,16 +1,71 @@
-from stellar_sdk.keypair import Keypair
-from stellar_sdk.transaction_builder import TransactionBuilder
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+import account
+import channels
 import settings
 
 
-def change_trust(asset_code, asset_issuer, limit=None):
-    keypair = Keypair.from_secret(settings.SECRET)
-    account = settings.HORIZON_SERVER.load_account(keypair.public_key)
+def diff(desired, prune=False, state=None):
+    """
+    Returns the (asset_code, asset_issuer, limit) change_trust operations
+    needed for the account to have the desired trustlines. desired is a list
+    of dicts with asset_code, issuer and optional limit keys. prune also
+    removes the other trustlines having a zero balance.
+    """
+    lines = account.trustlines(state or account.load())
+    ops = []
+    wanted = set()
+    for item in desired:
+        key = (item['asset_code'], item['issuer'])
+        wanted.add(key)
+        line = lines.get(key)
+        if line is None or not account.same_limit(line['limit'], item.get('limit')):
+            ops.append(key + (item.get('limit'),))
+    if prune:
+        for key, line in lines.items():
+            if key not in wanted and Decimal(line['balance']) == 0:
+                ops.append(key + ('0',))
+    return ops
+
+
+def _submit(ops):
+    def append_ops(builder):
+        for asset_code, asset_issuer, limit in ops:
+            builder.append_change_trust_op(asset_code, asset_issuer, limit,
+                    source=settings.PUBKEY)
+
+    response = channels.submit(append_ops)
+    account.trust_changed(account.load(), ops)
+    return response
+
 
-    builder = TransactionBuilder(source_account=account,
-            network_passphrase=settings.NETWORK_PASSPHRASE)
-    builder.append_change_trust_op(asset_code, asset_issuer, limit)
+def submit(ops):
+    """
+    Submits the change_trust operations packed in envelopes of up to
+    channels.MAX_OPERATIONS, one per channel account at a time, and returns
+    the Horizon responses.
+    """
+    chunks = [ops[i:i + channels.MAX_OPERATIONS]
+              for i in range(0, len(ops), channels.MAX_OPERATIONS)]
+    if len(chunks) <= 1 or channels.size() == 1:
+        return [_submit(chunk) for chunk in chunks]
+    with ThreadPoolExecutor(min(len(chunks), channels.size())) as executor:
+        return list(executor.map(_submit, chunks))
 
-    envelope = builder.build()
-    envelope.sign(keypair)
-    return settings.HORIZON_SERVER.submit_transaction(envelope)
+
+def sync(desired, prune=False):
+    ops = diff(desired, prune)
+    return {
+        'operations': [
+            {'asset_code': code, 'issuer': issuer, 'limit': limit}
+            for code, issuer, limit in ops
+        ],
+        'responses': submit(ops),
+    }
+
+
+def change_trust(asset_code, asset_issuer, limit=None):
+    result = sync([{'asset_code': asset_code, 'issuer': asset_issuer, 'limit': limit}])
+    if not result['responses']:
+        return {'status': 'unchanged'}
+    return result['responses'][0]
@@ -0,0 +1,148 @@
+"""
+Follows many SEP-6, SEP-24 or SEP-31 transactions until they are final.
+
+Each transaction is polled on its own schedule: the interval depends on its
+last status (short while the user or the wallet is expected to act, long
+while an external system is), and grows by settings.WATCH_BACKOFF every poll
+without change, up to settings.WATCH_MAX_INTERVAL. Only status changes are
+reported, and poll errors when they differ from the previous poll's.
+
+Unless a token is given, each poll uses the cached SEP-10 token, which is
+refreshed when it expires or when the anchor refuses it.
+"""
+import asyncio
+import time
+import aiohttp
+import settings
+from history import TERMINAL_STATUSES
+from utils import urljoin
+
+# seconds between polls, by transaction status
+POLL_INTERVALS = {
+    'incomplete': 5,
+    'pending_user_transfer_start': 5,
+    'pending_user_transfer_complete': 10,
+    'pending_stellar': 5,
+    'pending_trust': 10,
+    'pending_user': 10,
+    'pending_sender': 5,
+    'pending_anchor': 30,
+    'pending_receiver': 30,
+    'pending_customer_info_update': 60,
+    'pending_transaction_info_update': 60,
+    'pending_external': 120,
+}
+DEFAULT_INTERVAL = 30
+# stellar.toml server of each SEP's transaction endpoint
+SERVERS = {
+    'sep6': 'TRANSFER_SERVER',
+    'sep24': 'TRANSFER_SERVER_SEP0024',
+    'sep31': 'TRANSFER_SERVER_SEP0031',
+}
+
+
+async def _fetch(sep, transaction_id, token):
+    from aio import transport
+    from aio.sep1 import fetch_stellar_toml
+    if sep not in SERVERS:
+        raise ValueError(f'Unsupported SEP "{sep}"')
+    server = (await fetch_stellar_toml())[SERVERS[sep]]
+    if sep == 'sep31':
+        url, params = urljoin(server, 'transactions', transaction_id), None
+    else:
+        url, params = urljoin(server, 'transaction'), {'id': transaction_id}
+    response = await transport.get(url, idempotent=True, params=params,
+                                   headers={'Authorization': 'Bearer ' + token})
+    response.raise_for_status()
+    return response.json()['transaction']
+
+
+async def _poll(sep, transaction_id, token):
+    from aio.sep10 import get_token
+    current = token or await get_token()
+    try:
+        return await _fetch(sep, transaction_id, current)
+    except aiohttp.ClientResponseError as e:
+        if token or e.status not in (401, 403):
+            raise
+    return await _fetch(sep, transaction_id, await get_token(rejected=current))
+
+
+async def _follow(sep, transaction_id, token, events, deadline):
+    status = None
+    error = None
+    interval = 0
+    while True:
+        try:
+            transaction = await _poll(sep, transaction_id, token)
+            error = None
+        except Exception as e:
+            transaction = None
+            message = f'{type(e).__name__}: {e}'
+            if message != error:
+                await events.put({'id': transaction_id, 'error': message})
+            error = message
+
+        if transaction is not None and transaction.get('status') != status:
+            await events.put({
+                'id': transaction_id,
+                'previous_status': status,
+                'status': transaction.get('status'),
+                'transaction': transaction,
+            })
+            status = transaction.get('status')
+            if status in TERMINAL_STATUSES:
+                return
+            interval = POLL_INTERVALS.get(status, DEFAULT_INTERVAL)
+        else:
+            interval = min(max(interval, 1) * settings.WATCH_BACKOFF, settings.WATCH_MAX_INTERVAL)
+
+        if deadline is not None and time.monotonic() + interval > deadline:
+            return
+        await asyncio.sleep(interval)
+
+
+async def transitions(transaction_ids, sep='sep24', token=None, timeout=None):
+    """
+    Asynchronous generator yielding an event for each status change of the
+    given transactions, the first one being their current status. Events
+    are dicts with id, previous_status, status and transaction keys, or id
+    and error when a poll failed. It ends when every transaction reached a
+    final status, or after timeout seconds.
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    events = asyncio.Queue()
+    tasks = [asyncio.ensure_future(_follow(sep, transaction_id, token, events, deadline))
+             for transaction_id in set(transaction_ids)]
+    done = asyncio.ensure_future(asyncio.gather(*tasks))
+    try:
+        while not (done.done() and events.empty()):
+            getter = asyncio.ensure_future(events.get())
+            await asyncio.wait([getter, done], return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+            else:
+                getter.cancel()
+        done.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        done.cancel()
+
+
+def run(transaction_ids, out, sep='sep24', token=None, timeout=None):
+    """
+    Writes the transitions of the given transactions to out as JSON lines.
+    """
+    import json
+    import aio
+
+    async def _run():
+        try:
+            async for event in transitions(transaction_ids, sep, token, timeout):
+                out.write(json.dumps(event) + '\n')
+                out.flush()
+        finally:
+            await aio.close()
+
+    asyncio.run(_run())